@@ -0,0 +1,132 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from flask import jsonify
+from app import app
+import metrics
+
+# Weight of the latest request in the moving average of service time
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted in time"""
+
+    def __init__(self, retry_after):
+        super().__init__('Server is busy')
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds concurrent requests overall and per key, with a bounded wait queue
+
+    Requests over a limit wait up to ``wait_timeout`` seconds for a slot;
+    when the queue is full or the wait runs out they are rejected at once,
+    so a burst is shed quickly instead of every request timing out together.
+    """
+
+    def __init__(self, max_concurrent, max_per_key, max_waiting, wait_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_per_key = max_per_key
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._condition = threading.Condition()
+        self._active = 0
+        self._active_by_key = defaultdict(int)
+        self._waiting = 0
+        self._service_time = 0.1
+
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def waiting(self):
+        return self._waiting
+
+    def _has_slot(self, key):
+        if self._active >= self.max_concurrent:
+            return False
+        # A per-key limit of 0 or less means keys are not limited
+        return key is None or self.max_per_key <= 0 or self._active_by_key.get(key, 0) < self.max_per_key
+
+    def retry_after(self):
+        """Seconds a rejected client should wait, from the current backlog"""
+        backlog = self._waiting + self._active + 1
+        return max(1, math.ceil(backlog * self._service_time / self.max_concurrent))
+
+    def acquire(self, key=None):
+        with self._condition:
+            if not self._has_slot(key):
+                if self._waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise Overloaded(self.retry_after())
+
+                self._waiting += 1
+                try:
+                    admitted = self._condition.wait_for(lambda: self._has_slot(key), self.wait_timeout)
+                finally:
+                    self._waiting -= 1
+                if not admitted:
+                    self.rejected += 1
+                    raise Overloaded(self.retry_after())
+
+            self._active += 1
+            if key is not None:
+                self._active_by_key[key] += 1
+            self.admitted += 1
+
+    def release(self, key=None, elapsed=None):
+        with self._condition:
+            self._active -= 1
+            if key is not None:
+                self._active_by_key[key] -= 1
+                if not self._active_by_key[key]:
+                    del self._active_by_key[key]
+            if elapsed is not None:
+                self._service_time += SERVICE_TIME_ALPHA * (elapsed - self._service_time)
+            self._condition.notify_all()
+
+
+scan_admission = AdmissionController(
+    max_concurrent=app.config['ADMISSION_MAX_CONCURRENT'],
+    max_per_key=app.config['ADMISSION_MAX_PER_SESSION'],
+    max_waiting=app.config['ADMISSION_MAX_WAITING'],
+    wait_timeout=app.config['ADMISSION_WAIT_TIMEOUT']
+)
+
+metrics.registry.gauge('edutrack_scan_admission_active', 'Scan requests being handled', lambda: scan_admission.active)
+metrics.registry.gauge('edutrack_scan_admission_waiting', 'Scan requests waiting for a slot', lambda: scan_admission.waiting)
+metrics.registry.gauge('edutrack_scan_admission_rejected_total', 'Scan requests rejected with 429',
+                       lambda: scan_admission.rejected, 'counter')
+
+
+def admission_required(key_fn=lambda: None, controller=scan_admission):
+    """Admit the request through the controller, answering 429 when saturated"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not controller.max_concurrent:
+                return f(*args, **kwargs)
+
+            key = key_fn()
+            try:
+                controller.acquire(key)
+            except Overloaded as e:
+                response = jsonify({'success': False, 'message': 'Server is busy, please retry shortly', 'retry_after': e.retry_after})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                controller.release(key, time.perf_counter() - start)
+        return decorated_function
+    return decorator
@@ -1,33 +1,88 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from collections import defaultdict
+from functools import wraps
+import heapq
+import inspect
 import json
-from app import db
+import threading
+from app import app, db
+from cache import TTLCache
+from loader import get_loader
+from queries import build_query, window_start
+import counters
+import metrics
+import rollups
+from columnar import attendance_columns
+from singleflight import SingleFlight
+
+def cached(tags=lambda **arguments: (), ttl_setting='ANALYTICS_CACHE_TTL'):
+    """Cache a method's result by its arguments until one of its tags is invalidated"""
+    def decorator(method):
+        signature = inspect.signature(method)
+        
+        @wraps(method)
+        def decorated_function(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = {name: value for name, value in bound.arguments.items() if name != 'self'}
+            return self._cached(method.__name__, arguments, tags(**arguments), app.config[ttl_setting],
+                                lambda: method(self, *args, **kwargs))
+        return decorated_function
+    return decorator
 
 class AttendanceAnalytics:
     """Analytics engine for attendance data"""
     
     def __init__(self):
         self.db = db
+        self.cache = TTLCache(max_entries=app.config['ANALYTICS_CACHE_SIZE'])
+        self._generations = defaultdict(int)
+        self._generations_lock = threading.Lock()
+        self.flights = SingleFlight(timeout=app.config['SINGLE_FLIGHT_TIMEOUT'])
+    
+    def _cached(self, name, arguments, tags, ttl, compute):
+        """Serve a result from the cache, computing and storing it on a miss"""
+        # Entries are keyed by their tags' generations, so invalidation just moves the key on
+        with self._generations_lock:
+            key = (name, tuple(sorted(arguments.items())), tuple(self._generations[tag] for tag in tags))
+        
+        result = self.cache.get(key)
+        if result is None:
+            # Concurrent misses for the same key share one computation
+            result = self.flights.do(key, lambda: self._compute_and_store(key, ttl, compute))
+        return result
+    
+    def _compute_and_store(self, key, ttl, compute):
+        result = compute()
+        if result is not None:
+            self.cache.set(key, result, ttl)
+        return result
     
+    def invalidate(self, student_id=None, course_id=None):
+        """Drop cached results touching a student and/or course (everything if neither is given)"""
+        if student_id is None and course_id is None:
+            self.cache.clear()
+            return
+        with self._generations_lock:
+            if student_id is not None:
+                self._generations[('student', student_id)] += 1
+            if course_id is not None:
+                self._generations[('course', course_id)] += 1
+    
+    @cached(lambda student_id, course_id, days: [('student', student_id)] + ([('course', course_id)] if course_id else []))
     def get_student_analytics(self, student_id, course_id=None, days=30):
         """Get analytics for a specific student"""
         try:
-            # Base query
-            query = self.db.collection('attendance').where('student_id', '==', student_id)
-            
-            # Add course filter if specified
-            if course_id:
-                query = query.where('course_id', '==', course_id)
+            if attendance_columns is not None:
+                return self._get_student_analytics_columnar(student_id, course_id, days)
             
-            # Get attendance records
-            attendance_records = list(query.stream())
-            
-            # Filter by date range
-            cutoff_date = datetime.now() - timedelta(days=days)
-            recent_records = [
-                record for record in attendance_records 
-                if record.to_dict().get('timestamp', datetime.min) >= cutoff_date
-            ]
+            # Only the window's records, and only their timestamps
+            recent_records = list(build_query(
+                'attendance',
+                {'student_id': student_id, 'course_id': course_id},
+                since=window_start(days),
+                fields=['timestamp']
+            ).stream())
             
             # Calculate metrics
             total_sessions = self._get_total_sessions(course_id, days) if course_id else None
@@ -36,8 +91,8 @@ class AttendanceAnalytics:
             # Weekly breakdown
             weekly_data = self._get_weekly_breakdown(recent_records)
             
-            # Course breakdown
-            course_breakdown = self._get_course_breakdown(attendance_records)
+            # Course breakdown (all time) from the per-course counters
+            course_breakdown = self._get_course_breakdown(counters.student_courses(student_id, course_id))
             
             return {
                 'total_attendance': len(recent_records),
@@ -51,15 +106,10 @@ class AttendanceAnalytics:
             print(f"Error in get_student_analytics: {e}")
             return None
     
+    @cached(lambda course_id, lecturer_id, days: [('course', course_id)])
     def get_course_analytics(self, course_id, lecturer_id=None, days=30):
         """Get analytics for a specific course"""
         try:
-            # Verify lecturer owns course if specified
-            if lecturer_id:
-                course_doc = self.db.collection('courses').document(course_id).get()
-                if not course_doc.exists or course_doc.to_dict()['lecturer_id'] != lecturer_id:
-                    return None
-            
             # Get course info
             course_doc = self.db.collection('courses').document(course_id).get()
             if not course_doc.exists:
@@ -67,41 +117,40 @@ class AttendanceAnalytics:
             
             course_data = course_doc.to_dict()
             
+            # Verify lecturer owns course if specified
+            if lecturer_id and course_data['lecturer_id'] != lecturer_id:
+                return None
+            
             # Get enrollments
-            enrollments = list(self.db.collection('enrollments').where('course_id', '==', course_id).stream())
+            enrollments = list(build_query('enrollments', {'course_id': course_id}, fields=['student_id']).stream())
             total_students = len(enrollments)
             
-            # Get attendance records
-            cutoff_date = datetime.now() - timedelta(days=days)
-            attendance_records = list(
-                self.db.collection('attendance')
-                .where('course_id', '==', course_id)
-                .where('timestamp', '>=', cutoff_date)
-                .stream()
-            )
+            # Daily rollups answer the window in one read per day instead of per record
+            course_rollups = rollups.get_rollups(course_id, days)
             
             # Get sessions
-            sessions = list(
-                self.db.collection('attendance_sessions')
-                .where('course_id', '==', course_id)
-                .where('created_at', '>=', cutoff_date)
-                .stream()
-            )
+            sessions = list(build_query(
+                'attendance_sessions',
+                {'course_id': course_id},
+                since=window_start(days),
+                time_field='created_at',
+                fields=['created_at']
+            ).stream())
             
             total_sessions = len(sessions)
             
             # Calculate metrics
-            total_attendance = len(attendance_records)
+            total_attendance, _ = rollups.totals(course_rollups)
             avg_attendance_rate = (total_attendance / (total_sessions * total_students) * 100) if (total_sessions and total_students) else 0
             
             # Session breakdown
-            session_breakdown = self._get_session_breakdown(attendance_records, sessions)
+            session_breakdown = self._get_session_breakdown(sessions)
             
             # Student performance
-            student_performance = self._get_student_performance(course_id, enrollments, attendance_records)
+            student_performance = self._get_student_performance(course_id, enrollments, course_rollups)
             
             # Daily trends
-            daily_trends = self._get_daily_trends(attendance_records)
+            daily_trends = self._get_daily_trends(course_rollups)
             
             return {
                 'course_name': course_data.get('name', 'Unknown'),
@@ -119,25 +168,15 @@ class AttendanceAnalytics:
             print(f"Error in get_course_analytics: {e}")
             return None
     
+    @cached(ttl_setting='ANALYTICS_SYSTEM_CACHE_TTL')
     def get_system_analytics(self, days=30):
         """Get system-wide analytics"""
         try:
-            cutoff_date = datetime.now() - timedelta(days=days)
-            
             # Get all collections data
-            users = list(self.db.collection('users').stream())
-            courses = list(self.db.collection('courses').stream())
-            enrollments = list(self.db.collection('enrollments').stream())
-            attendance_records = list(
-                self.db.collection('attendance')
-                .where('timestamp', '>=', cutoff_date)
-                .stream()
-            )
-            sessions = list(
-                self.db.collection('attendance_sessions')
-                .where('created_at', '>=', cutoff_date)
-                .stream()
-            )
+            users = list(build_query('users', fields=['role']).stream())
+            courses = list(build_query('courses', fields=['name', 'code']).stream())
+            enrollments = list(build_query('enrollments', fields=['course_id']).stream())
+            system_rollups = rollups.get_rollups(days=days, fields=rollups.TOTAL_FIELDS)
             
             # User statistics
             user_stats = {
@@ -155,17 +194,18 @@ class AttendanceAnalytics:
             }
             
             # Attendance statistics
+            total_attendance, total_sessions = rollups.totals(system_rollups)
             attendance_stats = {
-                'total_sessions': len(sessions),
-                'total_attendance': len(attendance_records),
-                'avg_attendance_per_session': len(attendance_records) / len(sessions) if sessions else 0
+                'total_sessions': total_sessions,
+                'total_attendance': total_attendance,
+                'avg_attendance_per_session': total_attendance / total_sessions if total_sessions else 0
             }
             
             # Activity trends
-            activity_trends = self._get_system_activity_trends(attendance_records, sessions)
+            activity_trends = self._get_system_activity_trends(system_rollups)
             
             # Top performing courses
-            top_courses = self._get_top_performing_courses(days)
+            top_courses = self._get_top_performing_courses(days, courses, enrollments, system_rollups)
             
             return {
                 'user_stats': user_stats,
@@ -179,16 +219,33 @@ class AttendanceAnalytics:
             print(f"Error in get_system_analytics: {e}")
             return None
     
+    def _get_student_analytics_columnar(self, student_id, course_id, days):
+        """Student analytics computed from the in-memory attendance columns"""
+        columns = attendance_columns.refresh()
+        
+        # Select the student's rows, all time and within the window
+        all_rows = columns.select(student_id, course_id)
+        recent_rows = columns.select(student_id, course_id, since=window_start(days))
+        
+        # Calculate metrics
+        total_sessions = self._get_total_sessions(course_id, days) if course_id else None
+        attendance_rate = (len(recent_rows) / total_sessions * 100) if total_sessions else 0
+        
+        return {
+            'total_attendance': len(recent_rows),
+            'attendance_rate': round(attendance_rate, 1),
+            'weekly_data': [
+                {'week': week, 'count': count}
+                for week, count in columns.weekly_counts(recent_rows)
+            ],
+            'course_breakdown': self._get_course_breakdown(columns.counts_by(all_rows, 'course')),
+            'trend': self._trend(len(recent_rows))
+        }
+    
     def _get_total_sessions(self, course_id, days):
         """Get total sessions for a course in the given period"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        sessions = list(
-            self.db.collection('attendance_sessions')
-            .where('course_id', '==', course_id)
-            .where('created_at', '>=', cutoff_date)
-            .stream()
-        )
-        return len(sessions)
+        _, total_sessions = rollups.totals(rollups.get_rollups(course_id, days, fields=rollups.TOTAL_FIELDS))
+        return total_sessions
     
     def _get_weekly_breakdown(self, attendance_records):
         """Get weekly attendance breakdown"""
@@ -208,21 +265,12 @@ class AttendanceAnalytics:
             for week, count in sorted(weekly_data.items())
         ]
     
-    def _get_course_breakdown(self, attendance_records):
-        """Get attendance breakdown by course"""
-        course_data = defaultdict(int)
-        
-        for record in attendance_records:
-            record_data = record.to_dict()
-            course_id = record_data.get('course_id')
-            if course_id:
-                course_data[course_id] += 1
-        
-        # Get course names
+    def _get_course_breakdown(self, course_data):
+        """Get attendance breakdown by course from {course_id: count}"""
+        course_docs = get_loader().load_many('courses', list(course_data))
         breakdown = []
         for course_id, count in course_data.items():
-            course_doc = self.db.collection('courses').document(course_id).get()
-            course_name = course_doc.to_dict().get('name', 'Unknown') if course_doc.exists else 'Unknown'
+            course_name = course_docs.get(course_id, {}).get('name', 'Unknown')
             breakdown.append({
                 'course_id': course_id,
                 'course_name': course_name,
@@ -233,19 +281,16 @@ class AttendanceAnalytics:
     
     def _calculate_trend(self, attendance_records):
         """Calculate attendance trend (increasing/decreasing)"""
-        if len(attendance_records) < 2:
+        return self._trend(len(attendance_records))
+    
+    def _trend(self, attendance_count):
+        """Trend from comparing the first and second half of the records"""
+        if attendance_count < 2:
             return 'stable'
         
-        # Sort by timestamp
-        sorted_records = sorted(
-            attendance_records,
-            key=lambda x: x.to_dict().get('timestamp', datetime.min)
-        )
-        
         # Compare first and second half
-        mid_point = len(sorted_records) // 2
-        first_half = len(sorted_records[:mid_point])
-        second_half = len(sorted_records[mid_point:])
+        first_half = attendance_count // 2
+        second_half = attendance_count - first_half
         
         if second_half > first_half * 1.1:
             return 'increasing'
@@ -254,35 +299,29 @@ class AttendanceAnalytics:
         else:
             return 'stable'
     
-    def _get_session_breakdown(self, attendance_records, sessions):
+    def _get_session_breakdown(self, sessions):
         """Get breakdown of attendance by session"""
-        session_data = {}
+        # One counter document per session instead of scanning attendance rows
+        attendance_counts = counters.session_counts([session.id for session in sessions])
         
-        # Initialize session data
-        for session in sessions:
-            session_data[session.id] = {
+        return [
+            {
                 'session_id': session.id,
                 'created_at': session.to_dict().get('created_at'),
-                'attendance_count': 0
+                'attendance_count': attendance_counts[session.id]
             }
-        
-        # Count attendance per session
-        for record in attendance_records:
-            session_id = record.to_dict().get('session_id')
-            if session_id in session_data:
-                session_data[session_id]['attendance_count'] += 1
-        
-        return list(session_data.values())
+            for session in sessions
+        ]
     
-    def _get_student_performance(self, course_id, enrollments, attendance_records):
+    def _get_student_performance(self, course_id, enrollments, course_rollups):
         """Get individual student performance in a course"""
         student_data = {}
         
         # Initialize student data
-        for enrollment in enrollments:
-            student_id = enrollment.to_dict()['student_id']
-            student_doc = self.db.collection('users').document(student_id).get()
-            student_name = student_doc.to_dict().get('name', 'Unknown') if student_doc.exists else 'Unknown'
+        student_ids = [enrollment.to_dict()['student_id'] for enrollment in enrollments]
+        student_docs = get_loader().load_many('users', student_ids)
+        for student_id in student_ids:
+            student_name = student_docs.get(student_id, {}).get('name', 'Unknown')
             
             student_data[student_id] = {
                 'student_id': student_id,
@@ -290,11 +329,10 @@ class AttendanceAnalytics:
                 'attendance_count': 0
             }
         
-        # Count attendance per student
-        for record in attendance_records:
-            student_id = record.to_dict().get('student_id')
+        # Sum per-student counts from the daily rollups
+        for student_id, count in rollups.student_totals(course_rollups).items():
             if student_id in student_data:
-                student_data[student_id]['attendance_count'] += 1
+                student_data[student_id]['attendance_count'] += count
         
         # Sort by attendance count
         return sorted(
@@ -303,105 +341,80 @@ class AttendanceAnalytics:
             reverse=True
         )
     
-    def _get_daily_trends(self, attendance_records):
+    def _get_daily_trends(self, course_rollups):
         """Get daily attendance trends"""
-        daily_data = defaultdict(int)
-        
-        for record in attendance_records:
-            record_data = record.to_dict()
-            timestamp = record_data.get('timestamp')
-            if timestamp:
-                date_key = timestamp.strftime('%Y-%m-%d')
-                daily_data[date_key] += 1
-        
         return [
-            {'date': date, 'count': count}
-            for date, count in sorted(daily_data.items())
+            {'date': day['date'], 'count': day['attendance']}
+            for day in rollups.daily_totals(course_rollups)
+            if day['attendance']
         ]
     
-    def _get_system_activity_trends(self, attendance_records, sessions):
+    def _get_system_activity_trends(self, system_rollups):
         """Get system-wide activity trends"""
-        daily_attendance = defaultdict(int)
-        daily_sessions = defaultdict(int)
-        
-        # Count daily attendance
-        for record in attendance_records:
-            record_data = record.to_dict()
-            timestamp = record_data.get('timestamp')
-            if timestamp:
-                date_key = timestamp.strftime('%Y-%m-%d')
-                daily_attendance[date_key] += 1
-        
-        # Count daily sessions
-        for session in sessions:
-            session_data = session.to_dict()
-            timestamp = session_data.get('created_at')
-            if timestamp:
-                date_key = timestamp.strftime('%Y-%m-%d')
-                daily_sessions[date_key] += 1
-        
-        # Combine data
-        all_dates = set(daily_attendance.keys()) | set(daily_sessions.keys())
-        trends = []
+        return [
+            {
+                'date': day['date'],
+                'attendance': day['attendance'],
+                'sessions': day['sessions']
+            }
+            for day in rollups.daily_totals(system_rollups)
+        ]
+    
+    def _get_top_performing_courses(self, days=30, courses=None, enrollments=None, system_rollups=None, limit=10):
+        """Get top performing courses by attendance rate
         
-        for date in sorted(all_dates):
-            trends.append({
-                'date': date,
-                'attendance': daily_attendance[date],
-                'sessions': daily_sessions[date]
-            })
+        One pass over courses, enrollments and the window's daily rollups,
+        whatever the number of courses; callers may pass rows they already hold.
+        """
+        if courses is None:
+            courses = build_query('courses', fields=['name', 'code']).stream()
+        if enrollments is None:
+            enrollments = build_query('enrollments', fields=['course_id']).stream()
+        if system_rollups is None:
+            system_rollups = rollups.get_rollups(days=days, fields=rollups.TOTAL_FIELDS)
         
-        return trends
-    
-    def _get_top_performing_courses(self, days=30):
-        """Get top performing courses by attendance rate"""
-        cutoff_date = datetime.now() - timedelta(days=days)
-        courses = list(self.db.collection('courses').stream())
+        # Group enrollments, sessions and attendance by course
+        enrollment_counts = defaultdict(int)
+        for enrollment in enrollments:
+            enrollment_counts[enrollment.to_dict().get('course_id')] += 1
         
-        course_performance = []
+        session_counts = defaultdict(int)
+        attendance_counts = defaultdict(int)
+        for rollup in system_rollups:
+            session_counts[rollup['course_id']] += rollup.get('sessions', 0)
+            attendance_counts[rollup['course_id']] += rollup.get('attendance', 0)
         
-        for course in courses:
+        def performance(course):
             course_id = course.id
             course_data = course.to_dict()
-            
-            # Get enrollments
-            enrollments = len(list(
-                self.db.collection('enrollments')
-                .where('course_id', '==', course_id)
-                .stream()
-            ))
-            
-            # Get sessions
-            sessions = len(list(
-                self.db.collection('attendance_sessions')
-                .where('course_id', '==', course_id)
-                .where('created_at', '>=', cutoff_date)
-                .stream()
-            ))
-            
-            # Get attendance
-            attendance = len(list(
-                self.db.collection('attendance')
-                .where('course_id', '==', course_id)
-                .where('timestamp', '>=', cutoff_date)
-                .stream()
-            ))
+            enrolled = enrollment_counts[course_id]
+            sessions = session_counts[course_id]
+            attendance = attendance_counts[course_id]
             
             # Calculate rate
-            attendance_rate = (attendance / (sessions * enrollments) * 100) if (sessions and enrollments) else 0
+            attendance_rate = (attendance / (sessions * enrolled) * 100) if (sessions and enrolled) else 0
             
-            course_performance.append({
+            return {
                 'course_id': course_id,
                 'course_name': course_data.get('name', 'Unknown'),
                 'course_code': course_data.get('code', ''),
                 'attendance_rate': round(attendance_rate, 1),
-                'total_students': enrollments,
+                'total_students': enrolled,
                 'total_sessions': sessions,
                 'total_attendance': attendance
-            })
+            }
         
-        # Sort by attendance rate
-        return sorted(course_performance, key=lambda x: x['attendance_rate'], reverse=True)[:10]
+        # Keep only the top courses while scanning
+        return heapq.nlargest(limit, (performance(course) for course in courses), key=lambda x: x['attendance_rate'])
 
 # Global analytics instance
 analytics = AttendanceAnalytics()
+
+metrics.registry.gauge('edutrack_analytics_cache_hits_total', 'Analytics results served from the cache',
+                       lambda: analytics.cache.hits, 'counter')
+metrics.registry.gauge('edutrack_analytics_cache_misses_total', 'Analytics results computed',
+                       lambda: analytics.cache.misses, 'counter')
+metrics.registry.gauge('edutrack_analytics_coalesced_total', 'Analytics requests served by an identical computation in flight',
+                       lambda: analytics.flights.coalesced, 'counter')
+metrics.registry.gauge('edutrack_analytics_cache_entries', 'Analytics results held in the cache',
+                       lambda: len(analytics.cache))
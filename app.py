@@ -8,18 +8,88 @@ import qrcode
 import io
 import base64
 import uuid
+from datastore import create_client
+import metrics
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('firebase-service-account.json')
-firebase_admin.initialize_app(cred, {
-    'storageBucket': 'your-project-id.appspot.com'
-})
+# Key for signing attendance QR codes (defaults to the secret key)
+app.config['QR_SIGNING_KEY'] = os.environ.get('QR_SIGNING_KEY')
 
-db = firestore.client()
-bucket = storage.bucket()
+# Data backend: 'firestore' (default), or 'memory' / 'sqlite' for local runs and benchmarks
+app.config['DATA_BACKEND'] = os.environ.get('DATA_BACKEND', 'firestore')
+app.config['DATA_BACKEND_PATH'] = os.environ.get('DATA_BACKEND_PATH')
+
+if app.config['DATA_BACKEND'] == 'firestore':
+    # Initialize Firebase Admin SDK
+    cred = credentials.Certificate('firebase-service-account.json')
+    firebase_admin.initialize_app(cred, {
+        'storageBucket': 'your-project-id.appspot.com'
+    })
+    bucket = storage.bucket()
+else:
+    bucket = None
+
+db = create_client(app.config['DATA_BACKEND'], app.config['DATA_BACKEND_PATH'])
+
+# Account backend reads/writes per request and route (exposed at /metrics)
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+app.config['METRICS_RESPONSE_HEADER'] = os.environ.get('METRICS_RESPONSE_HEADER') == '1'
+
+# In-process cache of attendance sessions used by QR validation
+app.config['SESSION_CACHE_SIZE'] = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+app.config['SESSION_CACHE_TTL'] = int(os.environ.get('SESSION_CACHE_TTL', 300))
+app.config['ROSTER_CACHE_SIZE'] = int(os.environ.get('ROSTER_CACHE_SIZE', 2000))
+app.config['ROSTER_CACHE_TTL'] = int(os.environ.get('ROSTER_CACHE_TTL', 300))
+
+# Seconds between backend checks for scans handled by other workers (live attendance stream)
+app.config['LIVE_POLL_INTERVAL'] = float(os.environ.get('LIVE_POLL_INTERVAL', 2))
+
+# Seconds between in-process reconciliations of the system statistics (0 disables; schedule reconcile-stats with cron instead)
+app.config['STATS_RECONCILE_INTERVAL'] = int(os.environ.get('STATS_RECONCILE_INTERVAL', 0))
+
+# Seconds between in-process sweeps deactivating expired attendance sessions (0 disables)
+app.config['SESSION_SWEEP_INTERVAL'] = int(os.environ.get('SESSION_SWEEP_INTERVAL', 60))
+
+# Acknowledge scans once journaled locally and write them to the backend in batches
+app.config['ATTENDANCE_WRITE_BEHIND'] = os.environ.get('ATTENDANCE_WRITE_BEHIND') == '1'
+app.config['WRITE_BEHIND_PATH'] = os.environ.get('WRITE_BEHIND_PATH', 'attendance-queue.sqlite3')
+app.config['WRITE_BEHIND_INTERVAL'] = float(os.environ.get('WRITE_BEHIND_INTERVAL', 0.05))
+
+# Cached analytics results per process; scans and enrollments invalidate student and course results,
+# system results only expire
+app.config['ANALYTICS_CACHE_SIZE'] = int(os.environ.get('ANALYTICS_CACHE_SIZE', 1000))
+app.config['ANALYTICS_CACHE_TTL'] = int(os.environ.get('ANALYTICS_CACHE_TTL', 300))
+app.config['ANALYTICS_SYSTEM_CACHE_TTL'] = int(os.environ.get('ANALYTICS_SYSTEM_CACHE_TTL', 60))
+
+# Seconds a request waits for an identical analytics or report computation already running
+app.config['SINGLE_FLIGHT_TIMEOUT'] = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 30))
+
+# Serve student analytics from in-memory NumPy columns (requires numpy); full reload period in seconds
+app.config['ANALYTICS_COLUMNAR'] = os.environ.get('ANALYTICS_COLUMNAR') == '1'
+app.config['ANALYTICS_COLUMNAR_RELOAD'] = int(os.environ.get('ANALYTICS_COLUMNAR_RELOAD', 3600))
+
+# Seconds before the newest loaded record that each refresh re-reads, for scans committed after later ones
+app.config['ANALYTICS_COLUMNAR_LAG'] = int(os.environ.get('ANALYTICS_COLUMNAR_LAG', 60))
+
+# Documents read per round-trip when streaming reports
+app.config['REPORT_PAGE_SIZE'] = int(os.environ.get('REPORT_PAGE_SIZE', 300))
+
+# Most scan events accepted in one offline upload
+app.config['BULK_SCAN_LIMIT'] = int(os.environ.get('BULK_SCAN_LIMIT', 1000))
+
+# Seconds before upload that an unsigned offline scan time is trusted; earlier times count as that moment
+app.config['OFFLINE_SCAN_GRACE'] = int(os.environ.get('OFFLINE_SCAN_GRACE', 600))
+
+# Scan requests handled at once per process and per session (0 disables), and how many may wait
+app.config['ADMISSION_MAX_CONCURRENT'] = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 32))
+app.config['ADMISSION_MAX_PER_SESSION'] = int(os.environ.get('ADMISSION_MAX_PER_SESSION', 8))
+app.config['ADMISSION_MAX_WAITING'] = int(os.environ.get('ADMISSION_MAX_WAITING', 64))
+app.config['ADMISSION_WAIT_TIMEOUT'] = float(os.environ.get('ADMISSION_WAIT_TIMEOUT', 2))
+if app.config['METRICS_ENABLED']:
+    db = metrics.InstrumentedClient(db)
+    metrics.init_app(app)
 
 # Import routes
 from routes import *
@@ -3,6 +3,7 @@ from firebase_admin import auth
 from functools import wraps
 from app import app, db
 from datetime import datetime
+import system_stats
 
 def login_required(f):
     @wraps(f)
@@ -103,7 +104,10 @@ def signup():
                 'last_login': datetime.now()
             }
             
-            db.collection('users').document(uid).set(user_data)
+            batch = db.batch()
+            batch.set(db.collection('users').document(uid), user_data)
+            system_stats.adjust(batch, **system_stats.user_deltas(user_data))
+            batch.commit()
             
             # Only create session if approved
             if user_data['approved']:
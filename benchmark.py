@@ -0,0 +1,358 @@
+"""Benchmark the dashboard, scan and report hot paths against a local backend.
+
+Seeds a synthetic institution into the in-memory (or SQLite) backend, drives
+each endpoint through the Flask test client and records latency percentiles,
+backend round-trips and peak memory per request.
+
+    python benchmark.py --profile small --output bench_results.json
+    python benchmark.py --profile medium --compare bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+PROFILES = {
+    'small': {'students': 500, 'courses': 20, 'attendance': 20000},
+    'medium': {'students': 5000, 'courses': 200, 'attendance': 500000},
+    'large': {'students': 50000, 'courses': 2000, 'attendance': 5000000},
+}
+
+COURSES_PER_STUDENT = 6
+COURSES_PER_LECTURER = 4
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark EduTrack hot paths')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='small')
+    parser.add_argument('--students', type=int, help='Override the number of students')
+    parser.add_argument('--courses', type=int, help='Override the number of courses')
+    parser.add_argument('--attendance', type=int, help='Override the number of attendance records')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per endpoint')
+    parser.add_argument('--backend', choices=('memory', 'sqlite'), default='memory')
+    parser.add_argument('--path', help='SQLite file (reused if already seeded)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    return parser.parse_args()
+
+
+def seed_institution(db, students, courses, attendance, rng):
+    """Populate the backend with a synthetic institution"""
+    from counters import rebuild_counters
+    from system_stats import reconcile
+    from rollups import backfill_rollups
+
+    now = datetime.now()
+    batch = db.batch()
+
+    def write(reference, data):
+        nonlocal batch
+        batch.set(reference, data)
+        if len(batch) >= 500:
+            batch.commit()
+            batch = db.batch()
+
+    lecturers = max(1, courses // COURSES_PER_LECTURER)
+    write(db.collection('users').document('admin-0'), {
+        'uid': 'admin-0', 'email': 'admin@example.edu', 'name': 'Admin', 'role': 'admin',
+        'approved': True, 'created_at': now - timedelta(days=400),
+    })
+    for i in range(lecturers):
+        uid = f'lecturer-{i}'
+        write(db.collection('users').document(uid), {
+            'uid': uid, 'email': f'{uid}@example.edu', 'name': f'Lecturer {i}', 'role': 'lecturer',
+            'approved': i % 20 != 0, 'created_at': now - timedelta(days=400),
+        })
+    for i in range(students):
+        uid = f'student-{i}'
+        write(db.collection('users').document(uid), {
+            'uid': uid, 'email': f'{uid}@example.edu', 'name': f'Student {i}', 'role': 'student',
+            'approved': True, 'created_at': now - timedelta(days=400),
+        })
+
+    for i in range(courses):
+        write(db.collection('courses').document(f'course-{i}'), {
+            'name': f'Course {i}', 'code': f'C{i:04d}', 'description': 'Synthetic course',
+            'lecturer_id': f'lecturer-{i % lecturers}', 'created_at': now - timedelta(days=365),
+        })
+
+    # Enroll every student in a handful of courses
+    rosters = [[] for _ in range(courses)]
+    for i in range(students):
+        for course_index in rng.sample(range(courses), min(COURSES_PER_STUDENT, courses)):
+            rosters[course_index].append(f'student-{i}')
+            write(db.collection('enrollments').document(), {
+                'student_id': f'student-{i}', 'course_id': f'course-{course_index}',
+                'enrolled_at': now - timedelta(days=300), 'enrolled_by': 'admin-0',
+            })
+
+    # Spread attendance over sessions in the last year, ~80% turnout per session
+    enrolled = sum(len(roster) for roster in rosters) or 1
+    sessions_per_course = max(1, round(attendance / (enrolled * 0.8)))
+    for course_index, roster in enumerate(rosters):
+        course_id = f'course-{course_index}'
+        quota = round(attendance * len(roster) / enrolled)
+        for s in range(sessions_per_course):
+            created_at = now - timedelta(days=365 * (sessions_per_course - s) / sessions_per_course)
+            session_id = f'{course_id}-session-{s}'
+            write(db.collection('attendance_sessions').document(session_id), {
+                'session_id': session_id, 'course_id': course_id,
+                'lecturer_id': f'lecturer-{course_index % lecturers}',
+                'created_at': created_at, 'expires_at': created_at + timedelta(minutes=30), 'active': False,
+            })
+            attendees = min(len(roster), quota // sessions_per_course)
+            for student_id in rng.sample(roster, attendees):
+                write(db.collection('attendance').document(f'{session_id}_{student_id}'), {
+                    'student_id': student_id, 'course_id': course_id, 'session_id': session_id,
+                    'timestamp': created_at + timedelta(minutes=rng.randint(0, 29)),
+                    'marked_by': 'qr_scan', 'student_name': f'Student {student_id.split("-")[1]}',
+                })
+
+    batch.commit()
+    rebuild_counters(db)
+    reconcile(db)
+    backfill_rollups(db)
+    return rosters
+
+
+def load_rosters(db, courses):
+    """Rebuild course rosters from a previously seeded backend"""
+    rosters = [[] for _ in range(courses)]
+    for enrollment in db.collection('enrollments').stream():
+        data = enrollment.to_dict()
+        course_index = int(data['course_id'].split('-')[1])
+        if course_index < courses:
+            rosters[course_index].append(data['student_id'])
+    return rosters
+
+
+def login(client, uid, role, name):
+    with client.session_transaction() as sess:
+        sess['user'] = {'uid': uid, 'email': f'{uid}@example.edu', 'role': role, 'name': name, 'approved': True}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(name, db, client, make_request, count):
+    """Run an endpoint repeatedly and summarise latency, round-trips and memory
+
+    make_request(i) logs in and picks its parameters outside the measurement,
+    returning a callable that sends the request itself.
+    """
+    latencies = []
+    reads = []
+    writes = []
+    documents = []
+    statuses = {}
+
+    for i in range(count):
+        send = make_request(i)
+        before = dict(db.calls)
+        start = time.perf_counter()
+        response = send()
+        response.get_data()
+        latencies.append((time.perf_counter() - start) * 1000)
+        reads.append(db.calls['reads'] - before.get('reads', 0))
+        writes.append(db.calls['writes'] - before.get('writes', 0))
+        documents.append(db.calls['documents'] - before.get('documents', 0))
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    # Measure peak memory separately so tracing does not skew latency
+    send = make_request(count)
+    tracemalloc.start()
+    send().get_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'requests': count,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(statistics.mean(latencies), 3),
+            'max': round(max(latencies), 3),
+        },
+        'round_trips': {
+            'reads': round(statistics.mean(reads), 1),
+            'writes': round(statistics.mean(writes), 1),
+        },
+        'documents_read': round(statistics.mean(documents), 1),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'status_codes': {str(code): n for code, n in sorted(statuses.items())},
+    }
+    print(f"{name:<24} p50 {result['latency_ms']['p50']:>9.2f}ms  p99 {result['latency_ms']['p99']:>9.2f}ms  "
+          f"reads {result['round_trips']['reads']:>8}  docs {result['documents_read']:>9}  "
+          f"peak {result['peak_memory_kb']:>9.1f}KB")
+    return result
+
+
+def run_benchmarks(app, db, rosters, students, courses, count, rng):
+    from models import generate_qr_code
+
+    client = app.test_client()
+    lecturers = max(1, courses // COURSES_PER_LECTURER)
+    results = {}
+
+    def as_student(i):
+        uid = f'student-{rng.randrange(students)}'
+        login(client, uid, 'student', 'Student')
+        return uid
+
+    def as_lecturer(course_index):
+        login(client, f'lecturer-{course_index % lecturers}', 'lecturer', 'Lecturer')
+
+    def as_admin():
+        login(client, 'admin-0', 'admin', 'Admin')
+
+    def student_dashboard(i):
+        as_student(i)
+        return lambda: client.get('/student-dashboard')
+
+    def lecturer_dashboard(i):
+        as_lecturer(rng.randrange(courses))
+        return lambda: client.get('/lecturer-dashboard')
+
+    def admin_dashboard(i):
+        as_admin()
+        return lambda: client.get('/admin-dashboard')
+
+    results['student_dashboard'] = measure('student_dashboard', db, client, student_dashboard, count)
+    results['lecturer_dashboard'] = measure('lecturer_dashboard', db, client, lecturer_dashboard, count)
+    results['admin_dashboard'] = measure('admin_dashboard', db, client, admin_dashboard, count)
+
+    # Open a live session on the largest course and let its roster scan in
+    course_index = max(range(courses), key=lambda c: len(rosters[c]))
+    course_id = f'course-{course_index}'
+    qr = generate_qr_code(course_id, f'lecturer-{course_index % lecturers}', 30, f'Course {course_index}')
+    qr_data = qr['qr_payload']
+    scanners = list(rosters[course_index])
+    rng.shuffle(scanners)
+
+    def mark_attendance(i):
+        uid = scanners[i % len(scanners)]
+        login(client, uid, 'student', f'Student {uid.split("-")[1]}')
+        return lambda: client.post('/api/mark-attendance', json={'qr_data': qr_data})
+
+    results['mark_attendance'] = measure('mark_attendance', db, client, mark_attendance, min(count, len(scanners) - 1))
+
+    def live_attendance(i):
+        as_lecturer(course_index)
+        return lambda: client.get(f"/api/live-attendance/{qr['session_id']}")
+
+    results['live_attendance'] = measure('live_attendance', db, client, live_attendance, count)
+
+    def student_report(i):
+        uid = as_student(i)
+        return lambda: client.get(f'/api/reports/student/{uid}?format=csv')
+
+    def course_report(i):
+        as_admin()
+        course_id = f'course-{rng.randrange(courses)}'
+        return lambda: client.get(f'/api/reports/course/{course_id}?format=csv')
+
+    def system_report(i):
+        as_admin()
+        return lambda: client.get('/api/reports/system?format=csv')
+
+    def student_analytics(i):
+        uid = as_student(i)
+        return lambda: client.get(f'/api/analytics/student/{uid}?days=30')
+
+    def course_analytics(i):
+        as_admin()
+        course_id = f'course-{rng.randrange(courses)}'
+        return lambda: client.get(f'/api/analytics/course/{course_id}?days=365')
+
+    def system_analytics(i):
+        as_admin()
+        return lambda: client.get('/api/analytics/system?days=90')
+
+    results['analytics_student'] = measure('analytics_student', db, client, student_analytics, count)
+    results['analytics_course'] = measure('analytics_course', db, client, course_analytics, count)
+    results['analytics_system'] = measure('analytics_system', db, client, system_analytics, max(1, count // 10))
+    results['report_student'] = measure('report_student', db, client, student_report, count)
+    results['report_course'] = measure('report_course', db, client, course_report, count)
+    results['report_system'] = measure('report_system', db, client, system_report, max(1, count // 10))
+
+    return results
+
+
+def compare(results, previous_path):
+    """Print p50 latency and read deltas against an earlier results file"""
+    with open(previous_path) as f:
+        previous = json.load(f)['endpoints']
+
+    print(f'\nCompared with {previous_path}:')
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        old, new = previous[name], result
+        old_p50, new_p50 = old['latency_ms']['p50'], new['latency_ms']['p50']
+        change = ((new_p50 - old_p50) / old_p50 * 100) if old_p50 else 0
+        print(f"{name:<24} p50 {old_p50:>9.2f} -> {new_p50:>9.2f}ms ({change:+.1f}%)  "
+              f"reads {old['round_trips']['reads']} -> {new['round_trips']['reads']}")
+
+
+def main():
+    args = parse_args()
+    sizes = dict(PROFILES[args.profile])
+    for key in ('students', 'courses', 'attendance'):
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    # The backend must be chosen before the app module creates its client
+    os.environ['DATA_BACKEND'] = args.backend
+
+    # Background jobs would add reads and noise to whichever request they overlap
+    os.environ['STATS_RECONCILE_INTERVAL'] = '0'
+    os.environ['SESSION_SWEEP_INTERVAL'] = '0'
+    if args.path:
+        os.environ['DATA_BACKEND_PATH'] = args.path
+    from app import app, db
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    if db.collection('users').limit(1).get():
+        rosters = load_rosters(db, sizes['courses'])
+        print(f'Reusing existing dataset in {args.path}\n')
+    else:
+        rosters = seed_institution(db, sizes['students'], sizes['courses'], sizes['attendance'], rng)
+        print(f"Seeded {sizes['students']} students, {sizes['courses']} courses, "
+              f"{sizes['attendance']} attendance records in {time.perf_counter() - start:.1f}s\n")
+    db.calls.clear()
+
+    results = run_benchmarks(app, db, rosters, sizes['students'], sizes['courses'], args.requests, rng)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'meta': {
+                'profile': args.profile,
+                'sizes': sizes,
+                'backend': args.backend,
+                'requests_per_endpoint': args.requests,
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'generated_at': datetime.now().isoformat(),
+            },
+            'endpoints': results,
+        }, f, indent=2)
+    print(f'\nResults written to {args.output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from app import app, db
+from singleflight import SingleFlight
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Wall-clock datetimes are stored as microseconds since this instant
+EPOCH = datetime(1970, 1, 1)
+MICROS_PER_DAY = 86400 * 1000000
+
+# 1970-01-01 was a Thursday
+EPOCH_WEEKDAY = 3
+
+
+def _wall_micros(moment):
+    """Microseconds since EPOCH on the datetime's own wall clock, as strftime sees it"""
+    return (moment.replace(tzinfo=None) - EPOCH) // timedelta(microseconds=1)
+
+
+class _Interner:
+    """Maps string ids to dense integer codes and back"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ColumnSnapshot:
+    """A consistent view of the attendance columns at one moment
+
+    Refreshes replace the arrays rather than modifying them, and interners
+    only ever gain codes, so a snapshot stays valid while newer records are
+    loaded.
+    """
+
+    def __init__(self, columns):
+        self.students = columns.students
+        self.courses = columns.courses
+        self.sessions = columns.sessions
+        self.student = columns.student
+        self.course = columns.course
+        self.session = columns.session
+        self.timestamp = columns.timestamp
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def select(self, student_id=None, course_id=None, since=None):
+        """Row indices matching the filters (unknown ids match nothing)"""
+        mask = np.ones(len(self), dtype=bool)
+        for interner, column, value in ((self.students, self.student, student_id), (self.courses, self.course, course_id)):
+            if value is not None:
+                code = interner.codes.get(value)
+                if code is None:
+                    return np.empty(0, dtype=np.int64)
+                mask &= column == code
+        if since is not None:
+            mask &= self.timestamp >= _wall_micros(since)
+        return np.flatnonzero(mask)
+
+    def weekly_counts(self, rows):
+        """[(Monday YYYY-MM-DD, count)] for the given rows, oldest first"""
+        days = self.timestamp[rows] // MICROS_PER_DAY
+        week_starts, counts = np.unique(days - (days + EPOCH_WEEKDAY) % 7, return_counts=True)
+        return [(str(np.datetime64(int(day), 'D')), int(count)) for day, count in zip(week_starts, counts)]
+
+    def counts_by(self, rows, column):
+        """{id: count} grouping the given rows by 'student', 'course' or 'session'"""
+        interner = {'student': self.students, 'course': self.courses, 'session': self.sessions}[column]
+        counts = np.bincount(getattr(self, column)[rows], minlength=len(interner.values))
+        return {interner.values[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+
+class AttendanceColumns:
+    """Attendance held as NumPy columns for vectorized analytics
+
+    Student, course and session ids are interned to int32 codes and
+    timestamps kept as int64 microseconds. Each refresh re-reads records
+    from lag seconds before the newest one loaded, skipping ids already
+    held, so scans committed late with earlier timestamps are still
+    appended. Deletions and records backdated further by offline uploads
+    are picked up by invalidate() or the periodic full reload, which reads
+    outside the lock. Queries go through the snapshot refresh() returns.
+    """
+
+    def __init__(self, client=None, reload_interval=3600, lag=60):
+        self.db = client or db
+        self.reload_interval = reload_interval
+        self.lag = timedelta(seconds=lag)
+        self._lock = threading.Lock()
+        self._reloads = SingleFlight()
+        self._generation = 0
+        self._reset()
+
+    def _reset(self):
+        self.students = _Interner()
+        self.courses = _Interner()
+        self.sessions = _Interner()
+        self.student = np.empty(0, dtype=np.int32)
+        self.course = np.empty(0, dtype=np.int32)
+        self.session = np.empty(0, dtype=np.int32)
+        self.timestamp = np.empty(0, dtype=np.int64)
+        self._watermark = None
+        # Ids of records inside the lag window, which the next refresh reads again
+        self._recent = deque()
+        self._recent_ids = set()
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def invalidate(self, written_at=None):
+        """Force a full reload on the next refresh
+
+        With written_at, only if records that old would be missed by the
+        lag window.
+        """
+        with self._lock:
+            if written_at is None or self._watermark is None or written_at < self._watermark - self.lag:
+                self._loaded_at = None
+                self._generation += 1
+
+    def _query(self):
+        query = self.db.collection('attendance').select(['student_id', 'course_id', 'session_id', 'timestamp'])
+        if self._watermark is not None:
+            query = query.where('timestamp', '>=', self._watermark - self.lag)
+        return query.order_by('timestamp')
+
+    def refresh(self):
+        """Bring the columns up to date with the backend, returning a snapshot to query"""
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.reload_interval:
+                self._append(self._query().stream())
+                return ColumnSnapshot(self)
+        return self._reloads.do('reload', self._reload)
+
+    def _reload(self):
+        """Read every record into fresh columns, then swap them in"""
+        with self._lock:
+            generation = self._generation
+        fresh = AttendanceColumns(self.db, self.reload_interval, self.lag.total_seconds())
+        fresh._append(fresh._query().stream())
+
+        with self._lock:
+            for name in ('students', 'courses', 'sessions', 'student', 'course', 'session', 'timestamp',
+                         '_watermark', '_recent', '_recent_ids'):
+                setattr(self, name, getattr(fresh, name))
+            # Invalidated while reading: the records just read may already be out of date
+            self._loaded_at = time.monotonic() if generation == self._generation else None
+            return ColumnSnapshot(self)
+
+    def _append(self, records):
+        students, courses, sessions, timestamps = [], [], [], []
+        for record in records:
+            if record.id in self._recent_ids:
+                continue
+            record_data = record.to_dict()
+            timestamp = record_data.get('timestamp')
+            if timestamp is None:
+                continue
+
+            students.append(self.students.code(record_data.get('student_id')))
+            courses.append(self.courses.code(record_data.get('course_id')))
+            sessions.append(self.sessions.code(record_data.get('session_id')))
+            timestamps.append(_wall_micros(timestamp))
+
+            if self._watermark is None or timestamp > self._watermark:
+                self._watermark = timestamp
+            self._recent.append((timestamp, record.id))
+            self._recent_ids.add(record.id)
+
+            # Records are read in timestamp order, so the oldest remembered ids leave the window first
+            cutoff = self._watermark - self.lag
+            while self._recent[0][0] < cutoff:
+                self._recent_ids.discard(self._recent.popleft()[1])
+
+        if timestamps:
+            self.student = np.concatenate([self.student, np.array(students, dtype=np.int32)])
+            self.course = np.concatenate([self.course, np.array(courses, dtype=np.int32)])
+            self.session = np.concatenate([self.session, np.array(sessions, dtype=np.int32)])
+            self.timestamp = np.concatenate([self.timestamp, np.array(timestamps, dtype=np.int64)])
+
+attendance_columns = None
+
+if app.config['ANALYTICS_COLUMNAR']:
+    if np is None:
+        print("ANALYTICS_COLUMNAR is set but NumPy is not installed; using the default analytics engine")
+    else:
+        attendance_columns = AttendanceColumns(
+            reload_interval=app.config['ANALYTICS_COLUMNAR_RELOAD'],
+            lag=app.config['ANALYTICS_COLUMNAR_LAG'],
+        )
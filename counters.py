@@ -0,0 +1,200 @@
+import zlib
+from collections import Counter
+from datastore import Increment, MAX_BATCH_SIZE
+from app import app, db
+from loader import get_loader
+import summaries
+import system_stats
+import rollups
+
+COLLECTION = 'attendance_counters'
+
+# Aggregate documents touched by each attendance record (counters, system totals, daily rollup, session summary)
+COUNTERS_PER_RECORD = 7
+
+# Every scan in a lecture increments its course and session counters, so those
+# are spread across shards by student to stay under Firestore's per-document
+# write rate. Shard 0 keeps the unsharded document id.
+HOT_SHARDS = 8
+
+
+def _student_course_id(student_id, course_id):
+    return f'student_course__{student_id}__{course_id}'
+
+
+def _course_id(course_id):
+    return f'course__{course_id}'
+
+
+def _session_id(session_id):
+    return f'session__{session_id}'
+
+
+def _student_id(student_id):
+    return f'student__{student_id}'
+
+
+def _enrollment_id(course_id):
+    return f'course_enrollments__{course_id}'
+
+
+def _hot_shard(document_id, student_id):
+    index = zlib.crc32(student_id.encode()) % HOT_SHARDS
+    return document_id if index == 0 else f'{document_id}__{index}'
+
+
+def _shard_ids(document_id):
+    return [document_id] + [f'{document_id}__{index}' for index in range(1, HOT_SHARDS)]
+
+
+def _counter_docs(attendance_data):
+    """(document id, identifying fields) for every counter a record contributes to"""
+    student_id = attendance_data['student_id']
+    course_id = attendance_data['course_id']
+    session_id = attendance_data['session_id']
+    return [
+        (_student_course_id(student_id, course_id), {'scope': 'student_course', 'student_id': student_id, 'course_id': course_id}),
+        (_hot_shard(_course_id(course_id), student_id), {'scope': 'course', 'course_id': course_id}),
+        (_hot_shard(_session_id(session_id), student_id), {'scope': 'session', 'session_id': session_id, 'course_id': course_id}),
+        (_student_id(student_id), {'scope': 'student', 'student_id': student_id}),
+    ]
+
+
+def record_attendance(batch, attendance_data, delta=1):
+    """Add counter updates for an attendance write (or removal) to a batch"""
+    for document_id, fields in _counter_docs(attendance_data):
+        batch.set(db.collection(COLLECTION).document(document_id), dict(fields, count=Increment(delta)), merge=True)
+    system_stats.adjust(batch, total_attendance=delta)
+    rollups.record_attendance(batch, attendance_data, delta)
+
+
+def delete_attendance(records):
+    """Delete attendance snapshots, updating their counters and session summaries in batches"""
+    records = list(records)
+    sessions = get_loader().load_many('attendance_sessions', {record.to_dict()['session_id'] for record in records})
+    per_batch = MAX_BATCH_SIZE // (COUNTERS_PER_RECORD + 1)
+    batch = db.batch()
+    pending = 0
+    for record in records:
+        record_data = record.to_dict()
+        shards = sessions.get(record_data['session_id'], {}).get('summary_shards', 1)
+        batch.delete(record.reference)
+        record_attendance(batch, record_data, -1)
+        summaries.discard_attendance(batch, record_data, shards)
+        pending += 1
+        if pending >= per_batch:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+
+def record_enrollment(batch, course_id, delta=1):
+    """Add a course enrollment counter update to a batch"""
+    if delta:
+        reference = db.collection(COLLECTION).document(_enrollment_id(course_id))
+        batch.set(reference, {'scope': 'course_enrollments', 'course_id': course_id, 'count': Increment(delta)}, merge=True)
+
+
+def _get_counts(document_ids):
+    """Read several counters with a single round-trip"""
+    if not document_ids:
+        return {}
+    references = [db.collection(COLLECTION).document(document_id) for document_id in document_ids]
+    counts = {}
+    for snapshot in db.get_all(references):
+        if snapshot.exists:
+            counts[snapshot.id] = snapshot.to_dict().get('count', 0)
+    return counts
+
+
+def _get_sharded_counts(document_ids):
+    """Read sharded counters, summed across their shards, with a single round-trip"""
+    counts = _get_counts([shard for document_id in document_ids for shard in _shard_ids(document_id)])
+    return {document_id: sum(counts.get(shard, 0) for shard in _shard_ids(document_id)) for document_id in document_ids}
+
+
+def student_course_counts(student_id, course_ids):
+    """{course_id: attendance count} for one student"""
+    counts = _get_counts([_student_course_id(student_id, course_id) for course_id in course_ids])
+    return {course_id: counts.get(_student_course_id(student_id, course_id), 0) for course_id in course_ids}
+
+
+def course_student_counts(course_id, student_ids):
+    """{student_id: attendance count} for one course"""
+    counts = _get_counts([_student_course_id(student_id, course_id) for student_id in student_ids])
+    return {student_id: counts.get(_student_course_id(student_id, course_id), 0) for student_id in student_ids}
+
+
+def student_courses(student_id, course_id=None):
+    """{course_id: attendance count} for every course a student has attended, in one query"""
+    query = db.collection(COLLECTION).where('scope', '==', 'student_course').where('student_id', '==', student_id)
+    if course_id:
+        query = query.where('course_id', '==', course_id)
+    counts = {}
+    for counter in query.select(['course_id', 'count']).stream():
+        counter_data = counter.to_dict()
+        if counter_data.get('count', 0) > 0:
+            counts[counter_data['course_id']] = counter_data['count']
+    return counts
+
+
+def session_counts(session_ids):
+    """{session_id: attendance count}"""
+    counts = _get_sharded_counts([_session_id(session_id) for session_id in session_ids])
+    return {session_id: counts.get(_session_id(session_id), 0) for session_id in session_ids}
+
+
+def course_count(course_id):
+    return _get_sharded_counts([_course_id(course_id)])[_course_id(course_id)]
+
+
+def student_count(student_id):
+    return _get_counts([_student_id(student_id)]).get(_student_id(student_id), 0)
+
+
+def enrollment_counts(course_ids):
+    """{course_id: enrolled students}"""
+    counts = _get_counts([_enrollment_id(course_id) for course_id in course_ids])
+    return {course_id: counts.get(_enrollment_id(course_id), 0) for course_id in course_ids}
+
+
+def rebuild_counters(client=None):
+    """Recompute every counter from the raw attendance and enrollment records"""
+    client = client or db
+    totals = Counter()
+    fields = {}
+    for record in client.collection('attendance').stream():
+        for document_id, identity in _counter_docs(record.to_dict()):
+            totals[document_id] += 1
+            fields[document_id] = identity
+
+    for enrollment in client.collection('enrollments').select(['course_id']).stream():
+        course_id = enrollment.to_dict()['course_id']
+        totals[_enrollment_id(course_id)] += 1
+        fields[_enrollment_id(course_id)] = {'scope': 'course_enrollments', 'course_id': course_id}
+
+    batch = client.batch()
+    for counter in client.collection(COLLECTION).stream():
+        if counter.id not in totals:
+            batch.delete(counter.reference)
+            if len(batch) >= MAX_BATCH_SIZE:
+                batch.commit()
+                batch = client.batch()
+
+    for document_id, count in totals.items():
+        batch.set(client.collection(COLLECTION).document(document_id), dict(fields[document_id], count=count))
+        if len(batch) >= MAX_BATCH_SIZE:
+            batch.commit()
+            batch = client.batch()
+    batch.commit()
+
+    return len(totals)
+
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute attendance and enrollment counters from raw records."""
+    rebuilt = rebuild_counters()
+    print(f'Rebuilt {rebuilt} counters')
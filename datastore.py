@@ -0,0 +1,633 @@
+import pickle
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+
+# Firestore sentinels and errors are reused when the SDK is installed so that
+# application code behaves identically against every backend.
+try:
+    from google.api_core.exceptions import AlreadyExists, Aborted, NotFound
+except ImportError:
+    class AlreadyExists(Exception):
+        """Raised when creating a document that already exists"""
+
+    class Aborted(Exception):
+        """Raised when a commit is aborted by contention; nothing was written"""
+
+    class NotFound(Exception):
+        """Raised when updating a document that does not exist"""
+
+try:
+    from google.cloud.firestore_v1.transforms import Increment, ArrayUnion, ArrayRemove, DELETE_FIELD
+except ImportError:
+    class Increment:
+        """Atomically add a value to a numeric field"""
+
+        def __init__(self, value):
+            self.value = value
+
+    class ArrayUnion:
+        """Atomically add values missing from an array field"""
+
+        def __init__(self, values):
+            self.values = list(values)
+
+    class ArrayRemove:
+        """Atomically remove values from an array field"""
+
+        def __init__(self, values):
+            self.values = list(values)
+
+    DELETE_FIELD = object()
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+# Field path that orders by document id (Firestore's FieldPath.document_id())
+DOCUMENT_ID = '__name__'
+
+# Firestore rejects batches larger than this
+MAX_BATCH_SIZE = 500
+
+# Attempts at a batch commit that Firestore aborts under contention
+COMMIT_ATTEMPTS = 4
+
+BACKENDS = ('firestore', 'memory', 'sqlite')
+
+
+def create_client(backend='firestore', path=None):
+    """Create a data client for the configured backend"""
+    if backend == 'firestore':
+        from firebase_admin import firestore
+        return firestore.client()
+    if backend == 'memory':
+        return MemoryClient()
+    if backend == 'sqlite':
+        return SQLiteClient(path or 'edutrack.sqlite3')
+    raise ValueError(f"Unknown data backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+
+def _copy(value):
+    """Copy nested containers so callers never share state with the store"""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _get_field(data, field_path):
+    """Resolve a dotted field path, returning (found, value)"""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+def _order_value(document_id, data, field_path):
+    """Resolve an order_by field of a stored document, returning (found, value)"""
+    if field_path == DOCUMENT_ID:
+        return True, document_id
+    return _get_field(data, field_path)
+
+
+def _set_field(data, field_path, value):
+    """Assign a dotted field path, creating intermediate maps"""
+    parts = field_path.split('.')
+    target = data
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    _assign(target, parts[-1], value)
+
+
+def _assign(target, key, value):
+    """Assign a single key, applying transforms against the old value"""
+    if value is DELETE_FIELD:
+        target.pop(key, None)
+    elif isinstance(value, Increment):
+        current = target.get(key)
+        target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+    elif isinstance(value, ArrayUnion):
+        current = list(target.get(key) or [])
+        current.extend(v for v in value.values if v not in current)
+        target[key] = current
+    elif isinstance(value, ArrayRemove):
+        target[key] = [v for v in (target.get(key) or []) if v not in value.values]
+    elif isinstance(value, dict):
+        nested = target.get(key) if isinstance(target.get(key), dict) else {}
+        target[key] = nested
+        for nested_key, nested_value in value.items():
+            _assign(nested, nested_key, nested_value)
+    else:
+        target[key] = _copy(value)
+
+
+def _merge(existing, data):
+    """Merge data into an existing document the way set(merge=True) does"""
+    merged = _copy(existing) if existing else {}
+    for key, value in data.items():
+        _assign(merged, key, value)
+    return merged
+
+
+def _apply_update(existing, data):
+    """Apply update() semantics where keys are dotted field paths"""
+    updated = _copy(existing)
+    for field_path, value in data.items():
+        if isinstance(value, dict):
+            # A map value replaces the whole field rather than merging into it
+            _set_field(updated, field_path, {})
+        _set_field(updated, field_path, value)
+    return updated
+
+
+def _after_cursor(key, cursor, orders):
+    """Whether a row's ordering key sorts strictly after a start_after cursor"""
+    for (_, direction), value, cursor_value in zip(orders, key, cursor):
+        if value == cursor_value:
+            continue
+        return value < cursor_value if direction == DESCENDING else value > cursor_value
+    if len(cursor) > len(orders):
+        # Ties are broken by document id in the direction of the last ordering
+        descending = bool(orders) and orders[-1][1] == DESCENDING
+        return key[-1] < cursor[-1] if descending else key[-1] > cursor[-1]
+    return False
+
+
+def commit_with_retry(batch):
+    """Commit a batch, retrying with jittered backoff when Firestore aborts it
+
+    Batched writes are atomic, so an aborted commit wrote nothing and is safe
+    to repeat. AlreadyExists is not retried; it means a create lost to an
+    existing document.
+    """
+    for attempt in range(COMMIT_ATTEMPTS):
+        try:
+            return batch.commit()
+        except Aborted:
+            if attempt == COMMIT_ATTEMPTS - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt * (1 + random.random()))
+
+
+def _matches(op, value, expected):
+    """Evaluate a single where() comparison"""
+    try:
+        if op == '==':
+            return value == expected
+        if op == '!=':
+            return value != expected
+        if op == '<':
+            return value < expected
+        if op == '<=':
+            return value <= expected
+        if op == '>':
+            return value > expected
+        if op == '>=':
+            return value >= expected
+        if op == 'in':
+            return value in expected
+        if op == 'not-in':
+            return value not in expected
+        if op == 'array_contains':
+            return isinstance(value, list) and expected in value
+        if op == 'array_contains_any':
+            return isinstance(value, list) and any(v in value for v in expected)
+    except TypeError:
+        # Firestore never matches values of different types
+        return False
+    raise ValueError(f"Unsupported query operator '{op}'")
+
+
+class DocumentSnapshot:
+    """Point-in-time view of a document"""
+
+    def __init__(self, reference, data, field_paths=None):
+        self.reference = reference
+        self._data = data
+        self._field_paths = field_paths
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        if self._field_paths is None:
+            return _copy(self._data)
+
+        projected = {}
+        for field_path in self._field_paths:
+            found, value = _get_field(self._data, field_path)
+            if found:
+                _set_field(projected, field_path, value)
+        return projected
+
+    def get(self, field_path):
+        found, value = _get_field(self._data or {}, field_path)
+        return _copy(value) if found else None
+
+
+class DocumentReference:
+    """Reference to a single document in a collection"""
+
+    def __init__(self, client, collection_name, document_id):
+        self._client = client
+        self._collection = collection_name
+        self.id = document_id
+
+    @property
+    def path(self):
+        return f'{self._collection}/{self.id}'
+
+    def get(self, field_paths=None):
+        data = self._client._read(self._collection, self.id)
+        self._client._count_read(1 if data is not None else 0)
+        return DocumentSnapshot(self, data, field_paths)
+
+    def set(self, data, merge=False):
+        with self._client._lock:
+            if merge:
+                data = _merge(self._client._read(self._collection, self.id), data)
+            else:
+                data = _merge(None, data)
+            self._client._write(self._collection, self.id, data)
+
+    def create(self, data):
+        with self._client._lock:
+            if self._client._read(self._collection, self.id) is not None:
+                raise AlreadyExists(f'Document already exists: {self.path}')
+            self._client._write(self._collection, self.id, _merge(None, data))
+
+    def update(self, data):
+        with self._client._lock:
+            existing = self._client._read(self._collection, self.id)
+            if existing is None:
+                raise NotFound(f'No document to update: {self.path}')
+            self._client._write(self._collection, self.id, _apply_update(existing, data))
+
+    def delete(self):
+        with self._client._lock:
+            self._client._write(self._collection, self.id, None)
+
+
+class Query:
+    """Immutable query over a collection"""
+
+    def __init__(self, client, collection_name, filters=(), orders=(), limit_count=None,
+                 start_after_values=None, field_paths=None):
+        self._client = client
+        self._collection = collection_name
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._start_after = start_after_values
+        self._field_paths = field_paths
+
+    def _copy_with(self, **changes):
+        params = {
+            'filters': self._filters,
+            'orders': self._orders,
+            'limit_count': self._limit,
+            'start_after_values': self._start_after,
+            'field_paths': self._field_paths,
+        }
+        params.update(changes)
+        return Query(self._client, self._collection, **params)
+
+    def where(self, field_path, op_string, value):
+        return self._copy_with(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy_with(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy_with(limit_count=count)
+
+    def select(self, field_paths):
+        return self._copy_with(field_paths=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        if isinstance(document_fields_or_snapshot, DocumentSnapshot):
+            snapshot = document_fields_or_snapshot
+            values = [snapshot.id if field_path == DOCUMENT_ID else snapshot.get(field_path) for field_path, _ in self._orders]
+            values.append(snapshot.id)
+        else:
+            values = [document_fields_or_snapshot.get(field_path) for field_path, _ in self._orders]
+        return self._copy_with(start_after_values=values)
+
+    def stream(self):
+        return iter(self._client._run_query(self))
+
+    def get(self):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return AggregationQuery(self, alias or 'count')
+
+
+class AggregationResult:
+    """One aggregated value, as returned by Firestore"""
+
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+    """Count of the documents matching a query, computed without reading them"""
+
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self):
+        return [[AggregationResult(self._alias, self._query._client._run_count(self._query))]]
+
+
+class CollectionReference(Query):
+    """Reference to a top-level collection"""
+
+    def __init__(self, client, collection_name):
+        super().__init__(client, collection_name)
+        self.id = collection_name
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return datetime.now(), reference
+
+    def list_documents(self):
+        return [self.document(document_id) for document_id in self._client._document_ids(self._collection)]
+
+
+class WriteBatch:
+    """Group of writes applied atomically on commit"""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, merge))
+        return self
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, False))
+        return self
+
+    def update(self, reference, field_updates):
+        self._writes.append(('update', reference, field_updates, False))
+        return self
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, False))
+        return self
+
+    def commit(self):
+        if len(self._writes) > MAX_BATCH_SIZE:
+            raise ValueError(f'A batch may contain at most {MAX_BATCH_SIZE} writes')
+
+        client = self._client
+        with client._lock:
+            # Stage every write first so a failing precondition leaves the store untouched
+            staged = {}
+            for op, reference, data, merge in self._writes:
+                key = (reference._collection, reference.id)
+                existing = staged[key] if key in staged else client._read(*key)
+                if op == 'create':
+                    if existing is not None:
+                        raise AlreadyExists(f'Document already exists: {reference.path}')
+                    staged[key] = _merge(None, data)
+                elif op == 'set':
+                    staged[key] = _merge(existing if merge else None, data)
+                elif op == 'update':
+                    if existing is None:
+                        raise NotFound(f'No document to update: {reference.path}')
+                    staged[key] = _apply_update(existing, data)
+                else:
+                    staged[key] = None
+
+            client._write_many(staged)
+
+        self._writes = []
+        return []
+
+
+class MemoryClient:
+    """In-process stand-in for the Firestore client
+
+    Supports the query shapes the application uses. Equality filters are
+    answered from hash indexes built lazily per field, so lookups stay fast
+    at realistic collection sizes. ``calls`` counts the round-trips and
+    documents a real backend would have served.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._collections = defaultdict(dict)
+        self._indexes = defaultdict(dict)
+        self.calls = Counter()
+
+    def collection(self, collection_name):
+        return CollectionReference(self, collection_name)
+
+    def document(self, document_path):
+        collection_name, document_id = document_path.split('/', 1)
+        return DocumentReference(self, collection_name, document_id)
+
+    def get_all(self, references, field_paths=None):
+        snapshots = [
+            DocumentSnapshot(reference, self._read(reference._collection, reference.id), field_paths)
+            for reference in references
+        ]
+        self._count_read(sum(1 for snapshot in snapshots if snapshot.exists))
+        return iter(snapshots)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def collections(self):
+        return [self.collection(name) for name in list(self._collections)]
+
+    def _count_read(self, documents):
+        self.calls['reads'] += 1
+        self.calls['documents'] += documents
+
+    # Storage primitives
+
+    def _read(self, collection_name, document_id):
+        return self._collections[collection_name].get(document_id)
+
+    def _document_ids(self, collection_name):
+        return list(self._collections[collection_name])
+
+    def _write(self, collection_name, document_id, data):
+        self._write_many({(collection_name, document_id): data})
+
+    def _write_many(self, writes):
+        with self._lock:
+            self.calls['writes'] += 1
+            for (collection_name, document_id), data in writes.items():
+                documents = self._collections[collection_name]
+                self._unindex(collection_name, document_id, documents.get(document_id))
+                if data is None:
+                    documents.pop(document_id, None)
+                else:
+                    documents[document_id] = data
+                    self._index(collection_name, document_id, data)
+
+    # Equality indexes
+
+    def _index(self, collection_name, document_id, data):
+        for field_path, index in self._indexes[collection_name].items():
+            found, value = _get_field(data, field_path)
+            if found and value.__hash__ is not None:
+                index.setdefault(value, set()).add(document_id)
+
+    def _unindex(self, collection_name, document_id, data):
+        if data is None:
+            return
+        for field_path, index in self._indexes[collection_name].items():
+            found, value = _get_field(data, field_path)
+            if found and value.__hash__ is not None:
+                bucket = index.get(value)
+                if bucket is not None:
+                    bucket.discard(document_id)
+                    if not bucket:
+                        del index[value]
+
+    def _equality_index(self, collection_name, field_path):
+        indexes = self._indexes[collection_name]
+        if field_path not in indexes:
+            index = {}
+            for document_id, data in self._collections[collection_name].items():
+                found, value = _get_field(data, field_path)
+                if found and value.__hash__ is not None:
+                    index.setdefault(value, set()).add(document_id)
+            indexes[field_path] = index
+        return indexes[field_path]
+
+    def _run_query(self, query):
+        results = self._select(query)
+        self._count_read(len(results))
+        return [
+            DocumentSnapshot(DocumentReference(self, query._collection, document_id), data, query._field_paths)
+            for document_id, data in results
+        ]
+
+    def _run_count(self, query):
+        # Aggregations return no documents; Firestore bills them as one read per batch of index entries
+        count = len(self._select(query))
+        self._count_read(0)
+        return count
+
+    def _select(self, query):
+        with self._lock:
+            documents = self._collections[query._collection]
+
+            # Narrow candidates with the most selective equality filter
+            candidates = None
+            for field_path, op, value in query._filters:
+                if op == '==' and value.__hash__ is not None:
+                    ids = self._equality_index(query._collection, field_path).get(value, ())
+                    if candidates is None or len(ids) < len(candidates):
+                        candidates = ids
+            if candidates is None:
+                candidates = documents.keys()
+
+            results = []
+            for document_id in list(candidates):
+                data = documents[document_id]
+                if all(self._filter_matches(data, f) for f in query._filters):
+                    results.append((document_id, data))
+
+        # Documents missing an order_by field are excluded, as in Firestore
+        for field_path, _ in query._orders:
+            results = [r for r in results if _order_value(r[0], r[1], field_path)[0]]
+
+        descending = bool(query._orders) and query._orders[-1][1] == DESCENDING
+        results.sort(key=lambda r: r[0], reverse=descending)
+        for field_path, direction in reversed(query._orders):
+            results.sort(key=lambda r: _order_value(r[0], r[1], field_path)[1], reverse=direction == DESCENDING)
+
+        if query._start_after is not None:
+            results = [
+                (document_id, data) for document_id, data in results
+                if _after_cursor(
+                    [_order_value(document_id, data, field_path)[1] for field_path, _ in query._orders] + [document_id],
+                    query._start_after,
+                    query._orders,
+                )
+            ]
+
+        if query._limit is not None:
+            results = results[:query._limit]
+        return results
+
+    @staticmethod
+    def _filter_matches(data, query_filter):
+        field_path, op, expected = query_filter
+        found, value = _get_field(data, field_path)
+        return found and _matches(op, value, expected)
+
+
+class SQLiteClient(MemoryClient):
+    """Memory client whose documents are persisted to a SQLite file
+
+    Queries run against the in-memory copy; every write is also written
+    through to disk, so seeded datasets survive between runs.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            'collection TEXT NOT NULL, id TEXT NOT NULL, data BLOB NOT NULL, '
+            'PRIMARY KEY (collection, id))'
+        )
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        for collection_name, document_id, blob in self._conn.execute('SELECT collection, id, data FROM documents'):
+            self._collections[collection_name][document_id] = pickle.loads(blob)
+
+    def _write_many(self, writes):
+        with self._lock:
+            super()._write_many(writes)
+            upserts = [
+                (collection_name, document_id, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+                for (collection_name, document_id), data in writes.items() if data is not None
+            ]
+            deletes = [key for key, data in writes.items() if data is None]
+            with self._conn:
+                if upserts:
+                    self._conn.executemany('INSERT OR REPLACE INTO documents VALUES (?, ?, ?)', upserts)
+                if deletes:
+                    self._conn.executemany('DELETE FROM documents WHERE collection = ? AND id = ?', deletes)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,92 @@
+import json
+from collections.abc import Iterator
+from datetime import date
+
+# Encoded text is sent once at least this many characters are buffered
+CHUNK_SIZE = 16384
+
+
+def _default(value):
+    """Encode values the standard library encoder does not know"""
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _is_lazy(value):
+    return isinstance(value, Iterator)
+
+
+class StreamingJSONEncoder:
+    """Encode nested dicts, lists and iterators as JSON, yielding text as it goes
+
+    Iterators (generators included) become arrays encoded element by
+    element, so documents can be written as their pages are read. Dicts
+    holding an iterator are opened key by key; everything else is handed
+    to the standard library encoder whole. Output is compact unless pretty.
+    """
+
+    def __init__(self, pretty=False):
+        self.pretty = pretty
+        self.encoder = json.JSONEncoder(
+            default=_default,
+            indent=2 if pretty else None,
+            separators=(',', ': ') if pretty else (',', ':')
+        )
+
+    def _newline(self, level):
+        return '\n' + '  ' * level if self.pretty else ''
+
+    def iterencode(self, value, level=0):
+        if _is_lazy(value):
+            yield from self._encode_array(value, level)
+        elif isinstance(value, dict) and any(_is_lazy(item) for item in value.values()):
+            yield from self._encode_object(value, level)
+        else:
+            text = self.encoder.encode(value)
+            yield text.replace('\n', self._newline(level)) if self.pretty else text
+
+    def _encode_object(self, value, level):
+        yield '{'
+        for index, (key, item) in enumerate(value.items()):
+            yield (',' if index else '') + self._newline(level + 1) + json.dumps(str(key)) + (': ' if self.pretty else ':')
+            yield from self.iterencode(item, level + 1)
+        yield self._newline(level) + '}'
+
+    def _encode_array(self, items, level):
+        yield '['
+        empty = True
+        for item in items:
+            yield ('' if empty else ',') + self._newline(level + 1)
+            empty = False
+            yield from self.iterencode(item, level + 1)
+        yield ('' if empty else self._newline(level)) + ']'
+
+
+def iter_ndjson(report):
+    """One compact JSON document per line: the report's plain fields, then each streamed item
+
+    Items are tagged with the name of the section they came from.
+    """
+    encoder = json.JSONEncoder(default=_default, separators=(',', ':'))
+    summary = {key: value for key, value in report.items() if not _is_lazy(value)}
+    yield encoder.encode(dict(summary, section='report')) + '\n'
+    for key, items in report.items():
+        if _is_lazy(items):
+            for item in items:
+                yield encoder.encode(dict(item, section=key)) + '\n'
+
+
+def chunked(pieces, size=CHUNK_SIZE):
+    """Join small pieces of text into chunks of at least size characters"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
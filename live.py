@@ -0,0 +1,153 @@
+import json
+import queue
+import threading
+import time
+from app import app
+import summaries
+
+# Events buffered per connected client before it is considered too slow
+SUBSCRIBER_BUFFER = 1000
+
+# Left in a dropped client's queue so its stream ends and the browser reconnects
+DROPPED = object()
+
+
+def serialize_attendee(record_data):
+    """Attendee fields sent to the lecturer dashboard"""
+    timestamp = record_data.get('timestamp')
+    return {
+        'student_id': record_data['student_id'],
+        'student_name': record_data.get('student_name', 'Unknown'),
+        'timestamp': timestamp.isoformat() if timestamp else None
+    }
+
+
+def format_event(event, data):
+    """Encode one Server-Sent Event"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class SessionFeed:
+    """Attendees of one session and the clients listening for new ones"""
+
+    def __init__(self, session_id, shards=1):
+        self.session_id = session_id
+        self.shards = shards
+        self.attendees = []
+        self.seen = set()
+        self.subscribers = set()
+        self.loaded = False
+
+    def add(self, record_data):
+        """Record an attendee, returning its event payload if it is new"""
+        if record_data['student_id'] in self.seen:
+            return None
+        self.seen.add(record_data['student_id'])
+        attendee = serialize_attendee(record_data)
+        self.attendees.append(attendee)
+        return attendee
+
+
+class LiveHub:
+    """In-process fan-out of new attendees to connected lecturers
+
+    Each session with listeners has one feed. Scans handled by this process
+    are pushed immediately; scans handled by other workers are picked up by
+    a single read of the session summary every poll interval, however many
+    lecturers are connected.
+    """
+
+    def __init__(self, poll_interval=2.0):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._feeds = {}
+        self._poller = None
+
+    def subscribe(self, session_id, shards=1):
+        """Register a listener, returning its queue and the attendees so far"""
+        listener = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        # Registering while the feed is looked up keeps a departing listener from deleting it in between
+        with self._lock:
+            feed = self._feeds.get(session_id)
+            if feed is None:
+                feed = self._feeds[session_id] = SessionFeed(session_id, shards)
+            feed.subscribers.add(listener)
+            snapshot = list(feed.attendees) if feed.loaded else None
+
+        if snapshot is None:
+            try:
+                attendees = summaries.get_attendees(session_id, shards)
+            except Exception:
+                self.unsubscribe(session_id, listener)
+                raise
+            with self._lock:
+                for attendee in attendees:
+                    feed.add(attendee)
+                feed.loaded = True
+                snapshot = list(feed.attendees)
+                # Anything queued while loading is already in the snapshot
+                if listener in feed.subscribers:
+                    with listener.mutex:
+                        listener.queue.clear()
+        self._ensure_poller()
+        return listener, snapshot
+
+    def unsubscribe(self, session_id, listener):
+        with self._lock:
+            feed = self._feeds.get(session_id)
+            if feed is not None:
+                feed.subscribers.discard(listener)
+                if not feed.subscribers:
+                    del self._feeds[session_id]
+
+    def publish(self, session_id, record_data):
+        """Push a newly recorded attendee to the session's listeners"""
+        with self._lock:
+            feed = self._feeds.get(session_id)
+            if feed is None or not feed.loaded:
+                return
+            attendee = feed.add(record_data)
+            if attendee is not None:
+                self._broadcast(feed, attendee)
+
+    def _broadcast(self, feed, attendee):
+        for listener in list(feed.subscribers):
+            try:
+                listener.put_nowait(attendee)
+            except queue.Full:
+                # Drop clients that stopped reading; the sentinel ends their stream so they reconnect with a fresh snapshot
+                feed.subscribers.discard(listener)
+                with listener.mutex:
+                    listener.queue.clear()
+                listener.put_nowait(DROPPED)
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, name='live-attendance', daemon=True)
+                self._poller.start()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                feeds = [feed for feed in self._feeds.values() if feed.loaded]
+                if not self._feeds:
+                    self._poller = None
+                    return
+            for feed in feeds:
+                try:
+                    self._poll_feed(feed)
+                except Exception as e:
+                    print(f"Error polling live attendance for {feed.session_id}: {e}")
+
+    def _poll_feed(self, feed):
+        attendees = summaries.get_attendees(feed.session_id, feed.shards)
+        with self._lock:
+            for attendee_data in attendees:
+                attendee = feed.add(attendee_data)
+                if attendee is not None:
+                    self._broadcast(feed, attendee)
+
+
+live_hub = LiveHub(poll_interval=app.config['LIVE_POLL_INTERVAL'])
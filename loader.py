@@ -0,0 +1,64 @@
+from collections import defaultdict
+from flask import g, has_request_context
+from app import db
+
+# Upper bound on references sent in a single get_all call
+MAX_GET_ALL = 300
+
+
+class DocumentLoader:
+    """Request-scoped loader that batches document lookups by id
+
+    Ids are collected with prime() and resolved with one get_all call per
+    collection the first time any of them is needed. Results (including
+    missing documents) are cached for the rest of the request, so repeated
+    ids cost nothing.
+    """
+
+    def __init__(self, client=None):
+        self.db = client or db
+        self._cache = {}
+        self._pending = defaultdict(set)
+
+    def prime(self, collection, ids):
+        """Queue ids for the next batched fetch of a collection"""
+        for document_id in ids:
+            if document_id and (collection, document_id) not in self._cache:
+                self._pending[collection].add(document_id)
+
+    def load(self, collection, document_id):
+        """Get a document's data, or None if it does not exist"""
+        return self.load_many(collection, [document_id]).get(document_id)
+
+    def load_many(self, collection, ids):
+        """Get {id: data} for the given ids, omitting missing documents"""
+        ids = [document_id for document_id in ids if document_id]
+        self.prime(collection, ids)
+        self._dispatch(collection)
+
+        results = {}
+        for document_id in ids:
+            data = self._cache.get((collection, document_id))
+            if data is not None:
+                results[document_id] = dict(data)
+        return results
+
+    def _dispatch(self, collection):
+        pending = list(self._pending.pop(collection, ()))
+        for start in range(0, len(pending), MAX_GET_ALL):
+            chunk = pending[start:start + MAX_GET_ALL]
+            references = [self.db.collection(collection).document(document_id) for document_id in chunk]
+            for snapshot in self.db.get_all(references):
+                self._cache[(collection, snapshot.id)] = snapshot.to_dict() if snapshot.exists else None
+            # get_all may omit ids it could not resolve; remember them as missing
+            for document_id in chunk:
+                self._cache.setdefault((collection, document_id), None)
+
+
+def get_loader():
+    """Loader shared by everything handling the current request"""
+    if not has_request_context():
+        return DocumentLoader()
+    if 'document_loader' not in g:
+        g.document_loader = DocumentLoader()
+    return g.document_loader
@@ -0,0 +1,279 @@
+import threading
+import time
+from collections import defaultdict
+from flask import g, has_request_context, request
+
+BACKGROUND_ROUTE = '_background'
+
+
+class MetricsRegistry:
+    """Process-wide backend call and request counters, grouped by route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(lambda: defaultdict(float))
+        self._gauges = {}
+
+    def record(self, route, **values):
+        with self._lock:
+            totals = self._routes[route]
+            for key, value in values.items():
+                totals[key] += value
+
+    def gauge(self, name, help_text, fn, metric_type='gauge'):
+        """Register a callable sampled each time metrics are rendered"""
+        self._gauges[name] = (help_text, fn, metric_type)
+
+    def snapshot(self):
+        with self._lock:
+            return {route: dict(totals) for route, totals in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        routes = self.snapshot()
+        lines = []
+        series = [
+            ('edutrack_requests_total', 'counter', 'Requests handled per route', 'requests'),
+            ('edutrack_request_seconds_total', 'counter', 'Wall time spent handling requests', 'request_seconds'),
+            ('edutrack_backend_reads_total', 'counter', 'Backend read round-trips', 'reads'),
+            ('edutrack_backend_writes_total', 'counter', 'Backend write round-trips', 'writes'),
+            ('edutrack_backend_documents_total', 'counter', 'Documents returned by the backend', 'documents'),
+            ('edutrack_backend_seconds_total', 'counter', 'Wall time spent waiting on the backend', 'backend_seconds'),
+        ]
+        for name, metric_type, help_text, key in series:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for route in sorted(routes):
+                value = routes[route].get(key, 0)
+                lines.append(f'{name}{{route="{route}"}} {_format(value)}')
+
+        for name, (help_text, fn, metric_type) in sorted(self._gauges.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {_format(fn())}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else f'{value:.6f}'
+
+
+registry = MetricsRegistry()
+
+
+def _current_route():
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return BACKGROUND_ROUTE
+
+
+def _record(reads=0, writes=0, documents=0, seconds=0.0):
+    """Attribute one backend call to the current request and route"""
+    if has_request_context():
+        stats = g.setdefault('backend_stats', defaultdict(float))
+        stats['reads'] += reads
+        stats['writes'] += writes
+        stats['documents'] += documents
+        stats['backend_seconds'] += seconds
+    else:
+        registry.record(BACKGROUND_ROUTE, reads=reads, writes=writes, documents=documents, backend_seconds=seconds)
+
+
+def request_stats():
+    """Backend usage of the current request so far"""
+    return dict(g.get('backend_stats') or {})
+
+
+def _unwrap(value):
+    return getattr(value, '_wrapped', value)
+
+
+class _Proxy:
+    """Forward everything not explicitly instrumented to the wrapped object"""
+
+    def __init__(self, wrapped):
+        self._wrapped = wrapped
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+
+class _SnapshotProxy(_Proxy):
+
+    @property
+    def reference(self):
+        return _DocumentProxy(self._wrapped.reference)
+
+
+class _DocumentProxy(_Proxy):
+
+    def get(self, *args, **kwargs):
+        start = time.perf_counter()
+        snapshot = self._wrapped.get(*args, **kwargs)
+        _record(reads=1, documents=1 if snapshot.exists else 0, seconds=time.perf_counter() - start)
+        return _SnapshotProxy(snapshot)
+
+    def _write(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return getattr(self._wrapped, method)(*args, **kwargs)
+        finally:
+            _record(writes=1, seconds=time.perf_counter() - start)
+
+    def set(self, *args, **kwargs):
+        return self._write('set', *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write('create', *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write('update', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+
+class _QueryProxy(_Proxy):
+
+    def where(self, *args, **kwargs):
+        return _QueryProxy(self._wrapped.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return _QueryProxy(self._wrapped.order_by(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return _QueryProxy(self._wrapped.limit(*args, **kwargs))
+
+    def select(self, *args, **kwargs):
+        return _QueryProxy(self._wrapped.select(*args, **kwargs))
+
+    def start_after(self, cursor):
+        return _QueryProxy(self._wrapped.start_after(_unwrap(cursor)))
+
+    def stream(self, *args, **kwargs):
+        # Count the round-trip up front and documents as they arrive
+        start = time.perf_counter()
+        documents = 0
+        try:
+            for snapshot in self._wrapped.stream(*args, **kwargs):
+                documents += 1
+                yield _SnapshotProxy(snapshot)
+        finally:
+            _record(reads=1, documents=documents, seconds=time.perf_counter() - start)
+
+    def get(self, *args, **kwargs):
+        return list(self.stream(*args, **kwargs))
+
+    def count(self, *args, **kwargs):
+        return _AggregationProxy(self._wrapped.count(*args, **kwargs))
+
+
+class _AggregationProxy(_Proxy):
+
+    def get(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._wrapped.get(*args, **kwargs)
+        finally:
+            _record(reads=1, seconds=time.perf_counter() - start)
+
+
+class _CollectionProxy(_QueryProxy):
+
+    def document(self, *args, **kwargs):
+        return _DocumentProxy(self._wrapped.document(*args, **kwargs))
+
+    def add(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            write_time, reference = self._wrapped.add(*args, **kwargs)
+        finally:
+            _record(writes=1, seconds=time.perf_counter() - start)
+        return write_time, _DocumentProxy(reference)
+
+
+class _BatchProxy(_Proxy):
+
+    def set(self, reference, *args, **kwargs):
+        self._wrapped.set(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def create(self, reference, *args, **kwargs):
+        self._wrapped.create(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def update(self, reference, *args, **kwargs):
+        self._wrapped.update(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def delete(self, reference, *args, **kwargs):
+        self._wrapped.delete(_unwrap(reference), *args, **kwargs)
+        return self
+
+    def __len__(self):
+        return len(self._wrapped)
+
+    def commit(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._wrapped.commit(*args, **kwargs)
+        finally:
+            _record(writes=1, seconds=time.perf_counter() - start)
+
+
+class InstrumentedClient(_Proxy):
+    """Data client wrapper that accounts every backend round-trip"""
+
+    def collection(self, *args, **kwargs):
+        return _CollectionProxy(self._wrapped.collection(*args, **kwargs))
+
+    def document(self, *args, **kwargs):
+        return _DocumentProxy(self._wrapped.document(*args, **kwargs))
+
+    def get_all(self, references, *args, **kwargs):
+        start = time.perf_counter()
+        snapshots = list(self._wrapped.get_all([_unwrap(r) for r in references], *args, **kwargs))
+        _record(reads=1, documents=sum(1 for s in snapshots if s.exists), seconds=time.perf_counter() - start)
+        return iter([_SnapshotProxy(s) for s in snapshots])
+
+    def batch(self, *args, **kwargs):
+        return _BatchProxy(self._wrapped.batch(*args, **kwargs))
+
+
+def init_app(app):
+    """Aggregate per-request backend usage by route"""
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _backend_calls_header(response):
+        if app.debug or app.config.get('METRICS_RESPONSE_HEADER'):
+            # Streamed bodies are still being produced, so this covers only the work done so far
+            stats = request_stats()
+            response.headers['X-Backend-Calls'] = (
+                f"reads={int(stats.get('reads', 0))}; writes={int(stats.get('writes', 0))}; "
+                f"documents={int(stats.get('documents', 0))}; ms={stats.get('backend_seconds', 0.0) * 1000:.1f}"
+            )
+        return response
+
+    @app.teardown_request
+    def _record_request(exc):
+        # Runs once a streamed response body has been fully sent
+        stats = request_stats()
+        elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+        registry.record(
+            _current_route(),
+            requests=1,
+            request_seconds=elapsed,
+            reads=stats.get('reads', 0),
+            writes=stats.get('writes', 0),
+            documents=stats.get('documents', 0),
+            backend_seconds=stats.get('backend_seconds', 0.0),
+        )
@@ -0,0 +1,70 @@
+from datastore import MAX_BATCH_SIZE
+from app import app, db
+from models import attendance_id
+import counters
+import system_stats
+
+
+def migrate_attendance_ids(client=None):
+    """Rewrite auto-id attendance records under deterministic ids
+
+    Records are re-keyed as <session_id>_<student_id>. When several records
+    exist for the same student and session only the earliest is kept.
+    Counters and system totals are rebuilt afterwards.
+    """
+    client = client or db
+    records = client.collection('attendance').stream()
+
+    kept = {}
+    moves = []
+    duplicates = []
+    for record in records:
+        data = record.to_dict()
+        target_id = attendance_id(data['session_id'], data['student_id'])
+        previous = kept.get(target_id)
+        if previous is None:
+            kept[target_id] = (record, data)
+            continue
+        # Keep the earliest scan of a duplicated pair
+        if data.get('timestamp') and previous[1].get('timestamp') and data['timestamp'] < previous[1]['timestamp']:
+            kept[target_id] = (record, data)
+            duplicates.append(previous[0])
+        else:
+            duplicates.append(record)
+
+    for target_id, (record, data) in kept.items():
+        if record.id != target_id:
+            moves.append((record, target_id, data))
+
+    batch = client.batch()
+    pending = 0
+    for record, target_id, data in moves:
+        batch.set(client.collection('attendance').document(target_id), data)
+        batch.delete(record.reference)
+        pending += 2
+        if pending >= MAX_BATCH_SIZE - 1:
+            batch.commit()
+            batch = client.batch()
+            pending = 0
+    for record in duplicates:
+        batch.delete(record.reference)
+        pending += 1
+        if pending >= MAX_BATCH_SIZE:
+            batch.commit()
+            batch = client.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+
+    if moves or duplicates:
+        counters.rebuild_counters(client)
+        system_stats.reconcile(client)
+
+    return len(moves), len(duplicates)
+
+
+@app.cli.command('migrate-attendance-ids')
+def migrate_attendance_ids_command():
+    """Re-key attendance records as <session_id>_<student_id> and drop duplicates."""
+    moved, removed = migrate_attendance_ids()
+    print(f'Re-keyed {moved} attendance records, removed {removed} duplicates')
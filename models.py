@@ -2,24 +2,114 @@ import qrcode
 import io
 import base64
 import uuid
-import json
 from datetime import datetime, timedelta
-from app import db, bucket
+from app import app, db, bucket
+from cache import TTLCache
+from tokens import sign_qr_token, verify_qr_token, scan_key
+from loader import get_loader
+import counters
+import summaries
+import rollups
+from summaries import shard_count
 
-def generate_qr_code(course_id, lecturer_id, duration_minutes=30):
+# Attendance sessions by id, shared by every scan this process handles
+session_cache = TTLCache(max_entries=app.config['SESSION_CACHE_SIZE'])
+
+# Enrolled student ids by course, loaded when a lecturer opens a session
+roster_cache = TTLCache(max_entries=app.config['ROSTER_CACHE_SIZE'])
+
+def attendance_id(session_id, student_id):
+    """Deterministic attendance document id, so a student can only be recorded once per session"""
+    return f'{session_id}_{student_id}'
+
+def _seconds_until(moment):
+    """Seconds from now until a (naive or timezone-aware) datetime"""
+    return (moment - datetime.now(moment.tzinfo)).total_seconds()
+
+def cache_session(session_data):
+    """Cache an active session until it expires (capped by SESSION_CACHE_TTL)"""
+    ttl = min(_seconds_until(session_data['expires_at']), app.config['SESSION_CACHE_TTL'])
+    session_cache.set(session_data['session_id'], session_data, ttl)
+
+def get_session(session_id):
+    """Get an attendance session, reading the backend only on a cache miss"""
+    session_data = session_cache.get(session_id)
+    if session_data is not None:
+        return session_data
+    
+    # Misses go through the request loader so primed sessions share one read
+    session_data = get_loader().load('attendance_sessions', session_id)
+    if session_data is None:
+        return None
+    
+    session_data.setdefault('session_id', session_id)
+    if session_data.get('active', False):
+        cache_session(session_data)
+    return session_data
+
+def load_roster(course_id):
+    """Load a course's enrolled student ids into the roster cache"""
+    enrollments = db.collection('enrollments').where('course_id', '==', course_id).select(['student_id']).stream()
+    roster = frozenset(enrollment.to_dict()['student_id'] for enrollment in enrollments)
+    roster_cache.set(course_id, roster, app.config['ROSTER_CACHE_TTL'])
+    return roster
+
+def is_enrolled(student_id, course_id):
+    """Check enrollment against the cached roster, confirming absences with a one-document query"""
+    roster = roster_cache.get(course_id)
+    if roster is None:
+        return student_id in load_roster(course_id)
+    if student_id in roster:
+        return True
+    
+    # Another process may have enrolled the student since the roster was cached
+    enrollments = (db.collection('enrollments')
+                   .where('student_id', '==', student_id)
+                   .where('course_id', '==', course_id)
+                   .select([])
+                   .limit(1)
+                   .get())
+    if not enrollments:
+        return False
+    add_to_roster(course_id, student_id)
+    return True
+
+def add_to_roster(course_id, student_id):
+    """Reflect a new enrollment in the cached roster, if one is loaded"""
+    roster = roster_cache.get(course_id)
+    if roster is not None:
+        roster_cache.set(course_id, roster | {student_id}, app.config['ROSTER_CACHE_TTL'])
+
+def remove_from_rosters(student_id):
+    """Drop a deleted student from every cached roster"""
+    for course_id in roster_cache.keys():
+        roster = roster_cache.get(course_id)
+        if roster is not None and student_id in roster:
+            roster_cache.set(course_id, roster - {student_id}, app.config['ROSTER_CACHE_TTL'])
+
+def add_attendance_writes(batch, attendance_data, shards=1):
+    """Add an attendance record, its counters and its session summary entry to a batch"""
+    attendance_ref = db.collection('attendance').document(attendance_id(attendance_data['session_id'], attendance_data['student_id']))
+    batch.create(attendance_ref, attendance_data)
+    counters.record_attendance(batch, attendance_data)
+    summaries.record_attendance(batch, attendance_data, shards)
+
+def is_session_open(session_data):
+    """Whether a session accepts scans now; the sweeper deactivates it some time after expiry"""
+    return session_data.get('active', False) and _seconds_until(session_data['expires_at']) > 0
+
+def generate_qr_code(course_id, lecturer_id, duration_minutes=30, course_name=None):
     """Generate QR code for attendance session"""
     
     # Create session data
     session_id = str(uuid.uuid4())
     expires_at = datetime.now() + timedelta(minutes=duration_minutes)
     
-    qr_data = {
-        'session_id': session_id,
-        'course_id': course_id,
-        'lecturer_id': lecturer_id,
-        'expires_at': expires_at.isoformat(),
-        'type': 'attendance'
-    }
+    # Signed token so scans can be checked without a backend read
+    qr_payload = sign_qr_token(course_id, session_id, expires_at)
+    
+    # Preload the roster so scans never query enrollments
+    roster = load_roster(course_id)
     
     # Store session in Firestore
     session_data = {
@@ -28,14 +118,20 @@ def generate_qr_code(course_id, lecturer_id, duration_minutes=30):
         'lecturer_id': lecturer_id,
         'created_at': datetime.now(),
         'expires_at': expires_at,
-        'active': True
+        'active': True,
+        'summary_shards': shard_count(len(roster)),
+        'course_name': course_name
     }
     
-    db.collection('attendance_sessions').document(session_id).set(session_data)
+    batch = db.batch()
+    batch.set(db.collection('attendance_sessions').document(session_id), session_data)
+    rollups.record_session(batch, session_data)
+    batch.commit()
+    cache_session(session_data)
     
     # Generate QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(json.dumps(qr_data))
+    qr = qrcode.QRCode(version=None, box_size=10, border=5)
+    qr.add_data(qr_payload)
     qr.make(fit=True)
     
     # Create QR code image
@@ -50,63 +146,67 @@ def generate_qr_code(course_id, lecturer_id, duration_minutes=30):
     
     return {
         'qr_code': f"data:image/png;base64,{qr_code_base64}",
+        'qr_payload': qr_payload,
         'session_id': session_id,
-        'expires_at': expires_at
+        'expires_at': expires_at,
+        'scan_key': scan_key(session_id)
     }
 
-def validate_attendance(qr_data_str, student_id):
-    """Validate QR code and check attendance eligibility"""
+def validate_attendance(qr_data_str, student_id, at=None):
+    """Validate QR code and check attendance eligibility
+    
+    Scans made offline are judged as of ``at``, the POSIX time they were made.
+    """
     
     try:
-        qr_data = json.loads(qr_data_str)
-        
-        # Check if it's an attendance QR code
-        if qr_data.get('type') != 'attendance':
-            return {'valid': False, 'message': 'Invalid QR code type'}
+        # Reject forged, malformed and expired codes before any backend call
+        token = verify_qr_token(qr_data_str, now=at)
+        if not token['valid']:
+            return token
         
-        session_id = qr_data.get('session_id')
-        course_id = qr_data.get('course_id')
+        session_id = token['session_id']
+        course_id = token['course_id']
         
         # Check if session exists and is active
-        session_doc = db.collection('attendance_sessions').document(session_id).get()
+        session_data = get_session(session_id)
         
-        if not session_doc.exists:
+        if session_data is None:
             return {'valid': False, 'message': 'Invalid session'}
         
-        session_data = session_doc.to_dict()
-        
-        # Check if session is still active
-        if not session_data.get('active', False):
-            return {'valid': False, 'message': 'Session is no longer active'}
-        
-        # Check if session has expired
         expires_at = session_data.get('expires_at')
-        if datetime.now() > expires_at:
-            # Deactivate expired session
-            db.collection('attendance_sessions').document(session_id).update({'active': False})
-            return {'valid': False, 'message': 'Session has expired'}
+        if at is None:
+            # Check if session is still active
+            if not session_data.get('active', False):
+                return {'valid': False, 'message': 'Session is no longer active'}
+            
+            # Check if session has expired; the sweeper deactivates it
+            if _seconds_until(expires_at) < 0:
+                return {'valid': False, 'message': 'Session has expired'}
+        else:
+            # Sessions are only deactivated once they expire, so an offline
+            # scan stands if it was made while the session was open
+            if not session_data.get('active', False) and _seconds_until(expires_at) > 0:
+                return {'valid': False, 'message': 'Session is no longer active'}
+            
+            created_at = session_data.get('created_at')
+            if created_at is not None and at < created_at.timestamp():
+                return {'valid': False, 'message': 'Scan time is before the session started'}
+            
+            if at > expires_at.timestamp():
+                return {'valid': False, 'message': 'Session has expired'}
         
         # Check if student is enrolled in the course
-        enrollment_query = db.collection('enrollments').where('student_id', '==', student_id).where('course_id', '==', course_id).limit(1)
-        enrollments = list(enrollment_query.stream())
-        
-        if not enrollments:
+        if not is_enrolled(student_id, course_id):
             return {'valid': False, 'message': 'You are not enrolled in this course'}
         
-        # Check if student has already marked attendance for this session
-        attendance_query = db.collection('attendance').where('student_id', '==', student_id).where('session_id', '==', session_id).limit(1)
-        existing_attendance = list(attendance_query.stream())
-        
-        if existing_attendance:
-            return {'valid': False, 'message': 'Attendance already marked for this session'}
-        
+        # Duplicate scans are rejected when the attendance document is created
         return {
             'valid': True,
             'course_id': course_id,
-            'session_id': session_id
+            'session_id': session_id,
+            'summary_shards': session_data.get('summary_shards', 1),
+            'course_name': session_data.get('course_name')
         }
         
-    except json.JSONDecodeError:
-        return {'valid': False, 'message': 'Invalid QR code format'}
     except Exception as e:
         return {'valid': False, 'message': f'Validation error: {str(e)}'}
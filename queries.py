@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+from app import db
+
+
+def window_start(days):
+    """Start of a trailing window of `days` days"""
+    return datetime.now() - timedelta(days=days)
+
+
+def build_query(collection, where=None, since=None, until=None, time_field='timestamp',
+                fields=None, order_by=None, direction='ASCENDING', client=None):
+    """Query with equality filters, a time window and a field projection applied by the backend
+
+    Filters whose value is None are skipped. ``fields`` lists the only
+    fields to fetch (an empty list fetches ids alone); None fetches whole
+    documents.
+    """
+    query = (client or db).collection(collection)
+    for field, value in (where or {}).items():
+        if value is not None:
+            query = query.where(field, '==', value)
+    if since is not None:
+        query = query.where(time_field, '>=', since)
+    if until is not None:
+        query = query.where(time_field, '<', until)
+    if fields is not None:
+        query = query.select(fields)
+    if order_by is not None:
+        query = query.order_by(order_by, direction=direction)
+    return query
+
+
+def iter_pages(query, page_size=300):
+    """Run an ordered query one page at a time, yielding each page as a list
+
+    Each page starts after the last document of the one before, so only a
+    single page is held in memory. The query must order on fields it fetches
+    (or on datastore.DOCUMENT_ID); documents missing an order field are skipped.
+    """
+    last = None
+    while True:
+        page_query = query.limit(page_size)
+        if last is not None:
+            page_query = page_query.start_after(last)
+        page = list(page_query.stream())
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last = page[-1]
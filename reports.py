@@ -1,9 +1,62 @@
 import csv
 import io
 from datetime import datetime, timedelta
-from flask import Response
+from flask import Response, stream_with_context
 from analytics import analytics
-from app import db
+from datastore import DOCUMENT_ID
+from app import app, db
+from loader import get_loader
+import counters
+from jsonstream import StreamingJSONEncoder, chunked, iter_ndjson
+import metrics
+from queries import build_query, iter_pages
+from singleflight import SingleFlight
+
+# Fields each report reads, so queries fetch nothing else
+STUDENT_RECORD_FIELDS = ['timestamp', 'course_id', 'session_id', 'marked_by']
+COURSE_RECORD_FIELDS = ['student_id', 'student_name', 'session_id', 'timestamp', 'marked_by']
+ENROLLMENT_FIELDS = ['student_id', 'enrolled_at']
+SESSION_FIELDS = ['created_at', 'expires_at', 'active']
+USER_FIELDS = ['name', 'email', 'role', 'approved', 'created_at', 'last_login']
+COURSE_FIELDS = ['name', 'code', 'description', 'lecturer_id', 'created_at']
+
+# Formats served by the streaming JSON encoder
+JSON_FORMATS = ('json', 'ndjson')
+
+
+def _encode_csv(blocks):
+    """Encode each block of rows as CSV text as soon as it is produced"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for rows in blocks:
+        writer.writerows(rows)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+
+
+def _csv_response(blocks, filename):
+    """Streaming CSV download written block by block while the request context stays open"""
+    return Response(
+        stream_with_context(_encode_csv(blocks)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+def _json_response(report_data, filename, format='json', pretty=False):
+    """Streaming JSON (compact unless pretty) or NDJSON download encoded as its pages are read"""
+    if format == 'ndjson':
+        pieces, mimetype = iter_ndjson(report_data), 'application/x-ndjson'
+    else:
+        pieces, mimetype = StreamingJSONEncoder(pretty).iterencode(report_data), 'application/json'
+    
+    return Response(
+        stream_with_context(chunked(pieces)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}.{format}'}
+    )
+
 
 class ReportGenerator:
     """Generate various types of reports"""
@@ -11,245 +64,274 @@ class ReportGenerator:
     def __init__(self):
         self.analytics = analytics
         self.db = db
+        self.flights = SingleFlight(timeout=app.config['SINGLE_FLIGHT_TIMEOUT'])
     
-    def generate_student_report(self, student_id, format='csv'):
+    def generate_student_report(self, student_id, format='csv', pretty=False):
         """Generate comprehensive student attendance report"""
         try:
-            # Get student info
-            student_doc = self.db.collection('users').document(student_id).get()
-            if not student_doc.exists:
+            report_data = self.flights.do(('student', student_id), lambda: self._load_student_report(student_id))
+            if report_data is None:
                 return None
             
-            student_data = student_doc.to_dict()
+            student_data, analytics_data = report_data
             
-            # Get analytics
-            analytics_data = self.analytics.get_student_analytics(student_id, days=90)
-            
-            # Get detailed attendance records
-            attendance_records = list(
-                self.db.collection('attendance')
-                .where('student_id', '==', student_id)
-                .order_by('timestamp', direction='DESCENDING')
-                .stream()
-            )
+            # Detailed attendance records are read page by page as the report is written
+            record_pages = iter_pages(build_query(
+                'attendance',
+                {'student_id': student_id},
+                fields=STUDENT_RECORD_FIELDS,
+                order_by='timestamp',
+                direction='DESCENDING'
+            ), app.config['REPORT_PAGE_SIZE'])
             
             if format == 'csv':
-                return self._generate_student_csv(student_data, analytics_data, attendance_records)
-            elif format == 'json':
-                return self._generate_student_json(student_data, analytics_data, attendance_records)
+                return self._generate_student_csv(student_data, analytics_data, record_pages)
+            elif format in JSON_FORMATS:
+                return self._generate_student_json(student_data, analytics_data, record_pages, format, pretty)
             
         except Exception as e:
             print(f"Error generating student report: {e}")
             return None
     
-    def generate_course_report(self, course_id, lecturer_id=None, format='csv'):
+    def _load_student_report(self, student_id):
+        """Read the student and their analytics (shared by concurrent identical requests)"""
+        # Get student info
+        student_doc = self.db.collection('users').document(student_id).get()
+        if not student_doc.exists:
+            return None
+        
+        student_data = student_doc.to_dict()
+        
+        # Get analytics
+        analytics_data = self.analytics.get_student_analytics(student_id, days=90)
+        
+        return student_data, analytics_data
+    
+    def generate_course_report(self, course_id, lecturer_id=None, format='csv', pretty=False):
         """Generate comprehensive course attendance report"""
         try:
-            # Verify access
-            course_doc = self.db.collection('courses').document(course_id).get()
-            if not course_doc.exists:
+            report_data = self.flights.do(('course', course_id), lambda: self._load_course_report(course_id))
+            if report_data is None:
                 return None
             
-            course_data = course_doc.to_dict()
+            course_data, analytics_data = report_data
             
+            # Verify access
             if lecturer_id and course_data['lecturer_id'] != lecturer_id:
                 return None
             
-            # Get analytics
-            analytics_data = self.analytics.get_course_analytics(course_id, lecturer_id, days=90)
-            
-            # Get detailed data
-            enrollments = list(self.db.collection('enrollments').where('course_id', '==', course_id).stream())
-            attendance_records = list(
-                self.db.collection('attendance')
-                .where('course_id', '==', course_id)
-                .order_by('timestamp', direction='DESCENDING')
-                .stream()
-            )
-            sessions = list(
-                self.db.collection('attendance_sessions')
-                .where('course_id', '==', course_id)
-                .order_by('created_at', direction='DESCENDING')
-                .stream()
-            )
+            # Sessions are read page by page as the report is written
+            page_size = app.config['REPORT_PAGE_SIZE']
+            session_pages = iter_pages(build_query(
+                'attendance_sessions',
+                {'course_id': course_id},
+                fields=SESSION_FIELDS,
+                order_by='created_at',
+                direction='DESCENDING'
+            ), page_size)
             
             if format == 'csv':
-                return self._generate_course_csv(course_data, analytics_data, enrollments, attendance_records, sessions)
-            elif format == 'json':
-                return self._generate_course_json(course_data, analytics_data, enrollments, attendance_records, sessions)
+                return self._generate_course_csv(course_data, analytics_data, session_pages)
+            elif format in JSON_FORMATS:
+                # Paged by document id, which every enrollment has
+                enrollment_pages = iter_pages(build_query(
+                    'enrollments',
+                    {'course_id': course_id},
+                    fields=ENROLLMENT_FIELDS,
+                    order_by=DOCUMENT_ID
+                ), page_size)
+                record_pages = iter_pages(build_query(
+                    'attendance',
+                    {'course_id': course_id},
+                    fields=COURSE_RECORD_FIELDS,
+                    order_by='timestamp',
+                    direction='DESCENDING'
+                ), page_size)
+                return self._generate_course_json(
+                    course_data, analytics_data, enrollment_pages, record_pages, session_pages, format, pretty
+                )
             
         except Exception as e:
             print(f"Error generating course report: {e}")
             return None
     
-    def generate_system_report(self, format='csv'):
+    def _load_course_report(self, course_id):
+        """Read the course and its analytics (shared by concurrent identical requests)"""
+        course_doc = self.db.collection('courses').document(course_id).get()
+        if not course_doc.exists:
+            return None
+        
+        course_data = course_doc.to_dict()
+        
+        # Get analytics (access is checked by the caller)
+        analytics_data = self.analytics.get_course_analytics(course_id, days=90)
+        
+        return course_data, analytics_data
+    
+    def generate_system_report(self, format='csv', pretty=False):
         """Generate system-wide report"""
         try:
-            # Get analytics
-            analytics_data = self.analytics.get_system_analytics(days=90)
-            
-            # Get detailed data
-            users = list(self.db.collection('users').stream())
-            courses = list(self.db.collection('courses').stream())
+            # Get analytics (shared by concurrent identical requests)
+            analytics_data = self.flights.do(('system',), lambda: self.analytics.get_system_analytics(days=90))
             
             if format == 'csv':
-                return self._generate_system_csv(analytics_data, users, courses)
-            elif format == 'json':
-                return self._generate_system_json(analytics_data, users, courses)
+                return self._generate_system_csv(analytics_data)
+            elif format in JSON_FORMATS:
+                # Users and courses are read page by page, in document id order so none are left out
+                page_size = app.config['REPORT_PAGE_SIZE']
+                user_pages = iter_pages(build_query('users', fields=USER_FIELDS, order_by=DOCUMENT_ID), page_size)
+                course_pages = iter_pages(build_query('courses', fields=COURSE_FIELDS, order_by=DOCUMENT_ID), page_size)
+                return self._generate_system_json(analytics_data, user_pages, course_pages, format, pretty)
             
         except Exception as e:
             print(f"Error generating system report: {e}")
             return None
     
-    def _generate_student_csv(self, student_data, analytics_data, attendance_records):
-        """Generate CSV report for student"""
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Header information
-        writer.writerow(['Student Attendance Report'])
-        writer.writerow(['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-        writer.writerow(['Student:', student_data.get('name', 'Unknown')])
-        writer.writerow(['Email:', student_data.get('email', 'Unknown')])
-        writer.writerow([])
-        
-        # Summary statistics
-        if analytics_data:
-            writer.writerow(['Summary Statistics'])
-            writer.writerow(['Total Attendance Records:', analytics_data['total_attendance']])
-            writer.writerow(['Attendance Rate:', f"{analytics_data['attendance_rate']}%"])
-            writer.writerow(['Trend:', analytics_data['trend']])
-            writer.writerow([])
-        
-        # Detailed attendance records
-        writer.writerow(['Detailed Attendance Records'])
-        writer.writerow(['Date', 'Time', 'Course', 'Session ID', 'Method'])
-        
-        for record in attendance_records:
-            record_data = record.to_dict()
-            timestamp = record_data.get('timestamp')
+    def _generate_student_csv(self, student_data, analytics_data, record_pages):
+        """Stream CSV report for student"""
+        def blocks():
+            # Header information
+            rows = [
+                ['Student Attendance Report'],
+                ['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
+                ['Student:', student_data.get('name', 'Unknown')],
+                ['Email:', student_data.get('email', 'Unknown')],
+                []
+            ]
             
-            # Get course name
-            course_doc = self.db.collection('courses').document(record_data.get('course_id', '')).get()
-            course_name = course_doc.to_dict().get('name', 'Unknown') if course_doc.exists else 'Unknown'
+            # Summary statistics
+            if analytics_data:
+                rows += [
+                    ['Summary Statistics'],
+                    ['Total Attendance Records:', analytics_data['total_attendance']],
+                    ['Attendance Rate:', f"{analytics_data['attendance_rate']}%"],
+                    ['Trend:', analytics_data['trend']],
+                    []
+                ]
             
-            writer.writerow([
-                timestamp.strftime('%Y-%m-%d') if timestamp else 'N/A',
-                timestamp.strftime('%H:%M:%S') if timestamp else 'N/A',
-                course_name,
-                record_data.get('session_id', 'N/A'),
-                record_data.get('marked_by', 'N/A')
-            ])
+            # Detailed attendance records
+            rows += [['Detailed Attendance Records'], ['Date', 'Time', 'Course', 'Session ID', 'Method']]
+            yield rows
+            
+            loader = get_loader()
+            for page in record_pages:
+                loader.prime('courses', [record.to_dict().get('course_id') for record in page])
+                
+                rows = []
+                for record in page:
+                    record_data = record.to_dict()
+                    timestamp = record_data.get('timestamp')
+                    
+                    # Get course name
+                    course_info = loader.load('courses', record_data.get('course_id'))
+                    course_name = course_info.get('name', 'Unknown') if course_info else 'Unknown'
+                    
+                    rows.append([
+                        timestamp.strftime('%Y-%m-%d') if timestamp else 'N/A',
+                        timestamp.strftime('%H:%M:%S') if timestamp else 'N/A',
+                        course_name,
+                        record_data.get('session_id', 'N/A'),
+                        record_data.get('marked_by', 'N/A')
+                    ])
+                yield rows
         
-        output.seek(0)
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=student_report_{student_data.get("name", "unknown")}.csv'}
-        )
+        return _csv_response(blocks(), f'student_report_{student_data.get("name", "unknown")}.csv')
     
-    def _generate_course_csv(self, course_data, analytics_data, enrollments, attendance_records, sessions):
-        """Generate CSV report for course"""
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Header information
-        writer.writerow(['Course Attendance Report'])
-        writer.writerow(['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-        writer.writerow(['Course:', course_data.get('name', 'Unknown')])
-        writer.writerow(['Code:', course_data.get('code', 'Unknown')])
-        writer.writerow([])
-        
-        # Summary statistics
-        if analytics_data:
-            writer.writerow(['Summary Statistics'])
-            writer.writerow(['Total Students:', analytics_data['total_students']])
-            writer.writerow(['Total Sessions:', analytics_data['total_sessions']])
-            writer.writerow(['Total Attendance:', analytics_data['total_attendance']])
-            writer.writerow(['Average Attendance Rate:', f"{analytics_data['avg_attendance_rate']}%"])
-            writer.writerow([])
-        
-        # Student performance
-        if analytics_data and analytics_data['student_performance']:
-            writer.writerow(['Student Performance'])
-            writer.writerow(['Student Name', 'Attendance Count', 'Attendance Rate'])
+    def _generate_course_csv(self, course_data, analytics_data, session_pages):
+        """Stream CSV report for course"""
+        def blocks():
+            # Header information
+            rows = [
+                ['Course Attendance Report'],
+                ['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
+                ['Course:', course_data.get('name', 'Unknown')],
+                ['Code:', course_data.get('code', 'Unknown')],
+                []
+            ]
             
-            total_sessions = analytics_data['total_sessions']
-            for student in analytics_data['student_performance']:
-                attendance_rate = (student['attendance_count'] / total_sessions * 100) if total_sessions else 0
-                writer.writerow([
-                    student['student_name'],
-                    student['attendance_count'],
-                    f"{attendance_rate:.1f}%"
-                ])
-            writer.writerow([])
-        
-        # Session breakdown
-        writer.writerow(['Session Details'])
-        writer.writerow(['Session ID', 'Date', 'Time', 'Attendance Count'])
-        
-        for session in sessions:
-            session_data = session.to_dict()
-            created_at = session_data.get('created_at')
+            # Summary statistics
+            if analytics_data:
+                rows += [
+                    ['Summary Statistics'],
+                    ['Total Students:', analytics_data['total_students']],
+                    ['Total Sessions:', analytics_data['total_sessions']],
+                    ['Total Attendance:', analytics_data['total_attendance']],
+                    ['Average Attendance Rate:', f"{analytics_data['avg_attendance_rate']}%"],
+                    []
+                ]
             
-            # Count attendance for this session
-            session_attendance = len([
-                r for r in attendance_records 
-                if r.to_dict().get('session_id') == session.id
-            ])
+            # Student performance
+            if analytics_data and analytics_data['student_performance']:
+                rows += [['Student Performance'], ['Student Name', 'Attendance Count', 'Attendance Rate']]
+                
+                total_sessions = analytics_data['total_sessions']
+                for student in analytics_data['student_performance']:
+                    attendance_rate = (student['attendance_count'] / total_sessions * 100) if total_sessions else 0
+                    rows.append([
+                        student['student_name'],
+                        student['attendance_count'],
+                        f"{attendance_rate:.1f}%"
+                    ])
+                rows.append([])
             
-            writer.writerow([
-                session.id,
-                created_at.strftime('%Y-%m-%d') if created_at else 'N/A',
-                created_at.strftime('%H:%M:%S') if created_at else 'N/A',
-                session_attendance
-            ])
+            # Session breakdown
+            rows += [['Session Details'], ['Session ID', 'Date', 'Time', 'Attendance Count']]
+            yield rows
+            
+            for page in session_pages:
+                session_counts = counters.session_counts([session.id for session in page])
+                
+                rows = []
+                for session in page:
+                    session_data = session.to_dict()
+                    created_at = session_data.get('created_at')
+                    
+                    rows.append([
+                        session.id,
+                        created_at.strftime('%Y-%m-%d') if created_at else 'N/A',
+                        created_at.strftime('%H:%M:%S') if created_at else 'N/A',
+                        session_counts[session.id]
+                    ])
+                yield rows
         
-        output.seek(0)
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=course_report_{course_data.get("code", "unknown")}.csv'}
-        )
+        return _csv_response(blocks(), f'course_report_{course_data.get("code", "unknown")}.csv')
     
-    def _generate_system_csv(self, analytics_data, users, courses):
-        """Generate CSV report for entire system"""
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
+    def _generate_system_csv(self, analytics_data):
+        """Stream CSV report for entire system"""
         # Header information
-        writer.writerow(['System Report'])
-        writer.writerow(['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-        writer.writerow([])
+        rows = [
+            ['System Report'],
+            ['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
+            []
+        ]
         
         # System statistics
         if analytics_data:
-            writer.writerow(['User Statistics'])
-            writer.writerow(['Total Users:', analytics_data['user_stats']['total']])
-            writer.writerow(['Students:', analytics_data['user_stats']['students']])
-            writer.writerow(['Lecturers:', analytics_data['user_stats']['lecturers']])
-            writer.writerow(['Admins:', analytics_data['user_stats']['admins']])
-            writer.writerow([])
-            
-            writer.writerow(['Course Statistics'])
-            writer.writerow(['Total Courses:', analytics_data['course_stats']['total']])
-            writer.writerow(['Total Enrollments:', analytics_data['course_stats']['total_enrollments']])
-            writer.writerow(['Avg Enrollment per Course:', f"{analytics_data['course_stats']['avg_enrollment_per_course']:.1f}"])
-            writer.writerow([])
-            
-            writer.writerow(['Attendance Statistics'])
-            writer.writerow(['Total Sessions:', analytics_data['attendance_stats']['total_sessions']])
-            writer.writerow(['Total Attendance:', analytics_data['attendance_stats']['total_attendance']])
-            writer.writerow(['Avg Attendance per Session:', f"{analytics_data['attendance_stats']['avg_attendance_per_session']:.1f}"])
-            writer.writerow([])
+            rows += [
+                ['User Statistics'],
+                ['Total Users:', analytics_data['user_stats']['total']],
+                ['Students:', analytics_data['user_stats']['students']],
+                ['Lecturers:', analytics_data['user_stats']['lecturers']],
+                ['Admins:', analytics_data['user_stats']['admins']],
+                [],
+                ['Course Statistics'],
+                ['Total Courses:', analytics_data['course_stats']['total']],
+                ['Total Enrollments:', analytics_data['course_stats']['total_enrollments']],
+                ['Avg Enrollment per Course:', f"{analytics_data['course_stats']['avg_enrollment_per_course']:.1f}"],
+                [],
+                ['Attendance Statistics'],
+                ['Total Sessions:', analytics_data['attendance_stats']['total_sessions']],
+                ['Total Attendance:', analytics_data['attendance_stats']['total_attendance']],
+                ['Avg Attendance per Session:', f"{analytics_data['attendance_stats']['avg_attendance_per_session']:.1f}"],
+                []
+            ]
         
         # Top performing courses
         if analytics_data and analytics_data['top_courses']:
-            writer.writerow(['Top Performing Courses'])
-            writer.writerow(['Course Name', 'Code', 'Attendance Rate', 'Students', 'Sessions'])
+            rows += [['Top Performing Courses'], ['Course Name', 'Code', 'Attendance Rate', 'Students', 'Sessions']]
             
             for course in analytics_data['top_courses']:
-                writer.writerow([
+                rows.append([
                     course['course_name'],
                     course['course_code'],
                     f"{course['attendance_rate']}%",
@@ -257,89 +339,84 @@ class ReportGenerator:
                     course['total_sessions']
                 ])
         
-        output.seek(0)
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=system_report.csv'}
-        )
+        return _csv_response([rows], 'system_report.csv')
     
-    def _generate_student_json(self, student_data, analytics_data, attendance_records):
-        """Generate JSON report for student"""
-        # Convert attendance records to serializable format
-        attendance_list = []
-        for record in attendance_records:
-            record_data = record.to_dict()
-            
-            # Get course name
-            course_doc = self.db.collection('courses').document(record_data.get('course_id', '')).get()
-            course_name = course_doc.to_dict().get('name', 'Unknown') if course_doc.exists else 'Unknown'
-            
-            attendance_list.append({
-                'date': record_data.get('timestamp').isoformat() if record_data.get('timestamp') else None,
-                'course_id': record_data.get('course_id'),
-                'course_name': course_name,
-                'session_id': record_data.get('session_id'),
-                'method': record_data.get('marked_by')
-            })
+    def _generate_student_json(self, student_data, analytics_data, record_pages, format='json', pretty=False):
+        """Stream JSON or NDJSON report for student"""
+        def attendance_records():
+            loader = get_loader()
+            for page in record_pages:
+                loader.prime('courses', [record.to_dict().get('course_id') for record in page])
+                
+                for record in page:
+                    record_data = record.to_dict()
+                    
+                    # Get course name
+                    course_info = loader.load('courses', record_data.get('course_id'))
+                    course_name = course_info.get('name', 'Unknown') if course_info else 'Unknown'
+                    
+                    yield {
+                        'date': record_data.get('timestamp'),
+                        'course_id': record_data.get('course_id'),
+                        'course_name': course_name,
+                        'session_id': record_data.get('session_id'),
+                        'method': record_data.get('marked_by')
+                    }
         
         report_data = {
             'report_type': 'student_attendance',
-            'generated_at': datetime.now().isoformat(),
+            'generated_at': datetime.now(),
             'student_info': {
                 'name': student_data.get('name'),
                 'email': student_data.get('email'),
                 'id': student_data.get('uid')
             },
             'analytics': analytics_data,
-            'attendance_records': attendance_list
+            'attendance_records': attendance_records()
         }
         
-        return Response(
-            json.dumps(report_data, indent=2),
-            mimetype='application/json',
-            headers={'Content-Disposition': f'attachment; filename=student_report_{student_data.get("name", "unknown")}.json'}
-        )
+        return _json_response(report_data, f'student_report_{student_data.get("name", "unknown")}', format, pretty)
     
-    def _generate_course_json(self, course_data, analytics_data, enrollments, attendance_records, sessions):
-        """Generate JSON report for course"""
-        # Convert data to serializable format
-        enrollment_list = []
-        for enrollment in enrollments:
-            enrollment_data = enrollment.to_dict()
-            student_doc = self.db.collection('users').document(enrollment_data['student_id']).get()
-            student_name = student_doc.to_dict().get('name', 'Unknown') if student_doc.exists else 'Unknown'
-            
-            enrollment_list.append({
-                'student_id': enrollment_data['student_id'],
-                'student_name': student_name,
-                'enrolled_at': enrollment_data.get('enrolled_at').isoformat() if enrollment_data.get('enrolled_at') else None
-            })
+    def _generate_course_json(self, course_data, analytics_data, enrollment_pages, record_pages, session_pages,
+                              format='json', pretty=False):
+        """Stream JSON or NDJSON report for course"""
+        def enrollments():
+            for page in enrollment_pages:
+                student_docs = get_loader().load_many('users', [enrollment.to_dict()['student_id'] for enrollment in page])
+                for enrollment in page:
+                    enrollment_data = enrollment.to_dict()
+                    yield {
+                        'student_id': enrollment_data['student_id'],
+                        'student_name': student_docs.get(enrollment_data['student_id'], {}).get('name', 'Unknown'),
+                        'enrolled_at': enrollment_data.get('enrolled_at')
+                    }
         
-        attendance_list = []
-        for record in attendance_records:
-            record_data = record.to_dict()
-            attendance_list.append({
-                'student_id': record_data.get('student_id'),
-                'student_name': record_data.get('student_name'),
-                'session_id': record_data.get('session_id'),
-                'timestamp': record_data.get('timestamp').isoformat() if record_data.get('timestamp') else None,
-                'method': record_data.get('marked_by')
-            })
+        def attendance_records():
+            for page in record_pages:
+                for record in page:
+                    record_data = record.to_dict()
+                    yield {
+                        'student_id': record_data.get('student_id'),
+                        'student_name': record_data.get('student_name'),
+                        'session_id': record_data.get('session_id'),
+                        'timestamp': record_data.get('timestamp'),
+                        'method': record_data.get('marked_by')
+                    }
         
-        session_list = []
-        for session in sessions:
-            session_data = session.to_dict()
-            session_list.append({
-                'session_id': session.id,
-                'created_at': session_data.get('created_at').isoformat() if session_data.get('created_at') else None,
-                'expires_at': session_data.get('expires_at').isoformat() if session_data.get('expires_at') else None,
-                'active': session_data.get('active', False)
-            })
+        def sessions():
+            for page in session_pages:
+                for session in page:
+                    session_data = session.to_dict()
+                    yield {
+                        'session_id': session.id,
+                        'created_at': session_data.get('created_at'),
+                        'expires_at': session_data.get('expires_at'),
+                        'active': session_data.get('active', False)
+                    }
         
         report_data = {
             'report_type': 'course_attendance',
-            'generated_at': datetime.now().isoformat(),
+            'generated_at': datetime.now(),
             'course_info': {
                 'name': course_data.get('name'),
                 'code': course_data.get('code'),
@@ -347,58 +424,54 @@ class ReportGenerator:
                 'lecturer_id': course_data.get('lecturer_id')
             },
             'analytics': analytics_data,
-            'enrollments': enrollment_list,
-            'attendance_records': attendance_list,
-            'sessions': session_list
+            'enrollments': enrollments(),
+            'attendance_records': attendance_records(),
+            'sessions': sessions()
         }
         
-        return Response(
-            json.dumps(report_data, indent=2),
-            mimetype='application/json',
-            headers={'Content-Disposition': f'attachment; filename=course_report_{course_data.get("code", "unknown")}.json'}
-        )
+        return _json_response(report_data, f'course_report_{course_data.get("code", "unknown")}', format, pretty)
     
-    def _generate_system_json(self, analytics_data, users, courses):
-        """Generate JSON report for entire system"""
-        # Convert data to serializable format
-        user_list = []
-        for user in users:
-            user_data = user.to_dict()
-            user_list.append({
-                'id': user.id,
-                'name': user_data.get('name'),
-                'email': user_data.get('email'),
-                'role': user_data.get('role'),
-                'approved': user_data.get('approved'),
-                'created_at': user_data.get('created_at').isoformat() if user_data.get('created_at') else None,
-                'last_login': user_data.get('last_login').isoformat() if user_data.get('last_login') else None
-            })
+    def _generate_system_json(self, analytics_data, user_pages, course_pages, format='json', pretty=False):
+        """Stream JSON or NDJSON report for entire system"""
+        def users():
+            for page in user_pages:
+                for user in page:
+                    user_data = user.to_dict()
+                    yield {
+                        'id': user.id,
+                        'name': user_data.get('name'),
+                        'email': user_data.get('email'),
+                        'role': user_data.get('role'),
+                        'approved': user_data.get('approved'),
+                        'created_at': user_data.get('created_at'),
+                        'last_login': user_data.get('last_login')
+                    }
         
-        course_list = []
-        for course in courses:
-            course_data = course.to_dict()
-            course_list.append({
-                'id': course.id,
-                'name': course_data.get('name'),
-                'code': course_data.get('code'),
-                'description': course_data.get('description'),
-                'lecturer_id': course_data.get('lecturer_id'),
-                'created_at': course_data.get('created_at').isoformat() if course_data.get('created_at') else None
-            })
+        def courses():
+            for page in course_pages:
+                for course in page:
+                    course_data = course.to_dict()
+                    yield {
+                        'id': course.id,
+                        'name': course_data.get('name'),
+                        'code': course_data.get('code'),
+                        'description': course_data.get('description'),
+                        'lecturer_id': course_data.get('lecturer_id'),
+                        'created_at': course_data.get('created_at')
+                    }
         
         report_data = {
             'report_type': 'system_overview',
-            'generated_at': datetime.now().isoformat(),
+            'generated_at': datetime.now(),
             'analytics': analytics_data,
-            'users': user_list,
-            'courses': course_list
+            'users': users(),
+            'courses': courses()
         }
         
-        return Response(
-            json.dumps(report_data, indent=2),
-            mimetype='application/json',
-            headers={'Content-Disposition': 'attachment; filename=system_report.json'}
-        )
+        return _json_response(report_data, 'system_report', format, pretty)
 
 # Global report generator instance
 report_generator = ReportGenerator()
+
+metrics.registry.gauge('edutrack_report_coalesced_total', 'Report requests served by an identical request in flight',
+                       lambda: report_generator.flights.coalesced, 'counter')
@@ -0,0 +1,156 @@
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from datastore import Increment, MAX_BATCH_SIZE
+from app import app, db
+
+COLLECTION = 'daily_rollups'
+
+# Attendance increments are spread across shards of a day's rollup by student,
+# so a lecture's scan burst stays under Firestore's per-document write rate.
+# Readers sum every rollup of a day, and each student only ever lands in one shard.
+ATTENDANCE_SHARDS = 8
+
+# Rollup fields needed for totals and trends, without the per-student counts
+TOTAL_FIELDS = ['course_id', 'date', 'attendance', 'sessions']
+
+
+def _date_key(moment):
+    return moment.strftime('%Y-%m-%d')
+
+
+def _rollup_id(course_id, date):
+    return f'{course_id}__{date}'
+
+
+def _attendance_shard_id(course_id, date, student_id):
+    index = zlib.crc32(student_id.encode()) % ATTENDANCE_SHARDS
+    return _rollup_id(course_id, date) if index == 0 else f'{_rollup_id(course_id, date)}__{index}'
+
+
+def record_attendance(batch, attendance_data, delta=1):
+    """Count an attendance record (or its removal) in its course's daily rollup"""
+    timestamp = attendance_data.get('timestamp')
+    if timestamp is None:
+        return
+    course_id = attendance_data['course_id']
+    student_id = attendance_data['student_id']
+    date = _date_key(timestamp)
+    batch.set(db.collection(COLLECTION).document(_attendance_shard_id(course_id, date, student_id)), {
+        'course_id': course_id,
+        'date': date,
+        'attendance': Increment(delta),
+        'students': {student_id: Increment(delta)}
+    }, merge=True)
+
+
+def record_session(batch, session_data, delta=1):
+    """Count an attendance session in its course's daily rollup"""
+    course_id = session_data['course_id']
+    date = _date_key(session_data['created_at'])
+    batch.set(db.collection(COLLECTION).document(_rollup_id(course_id, date)), {
+        'course_id': course_id,
+        'date': date,
+        'sessions': Increment(delta)
+    }, merge=True)
+
+
+def get_rollups(course_id=None, days=30, fields=None):
+    """Daily rollups for the last `days` days (one course, or every course), oldest first
+
+    ``fields`` limits what is fetched; TOTAL_FIELDS skips the per-student maps.
+    """
+    query = db.collection(COLLECTION)
+    if course_id:
+        query = query.where('course_id', '==', course_id)
+    query = query.where('date', '>=', _date_key(datetime.now() - timedelta(days=days)))
+    if fields is not None:
+        query = query.select(fields)
+    return sorted((rollup.to_dict() for rollup in query.stream()), key=lambda rollup: rollup['date'])
+
+
+def totals(rollups):
+    """(attendance, sessions) summed over rollups"""
+    return (
+        sum(rollup.get('attendance', 0) for rollup in rollups),
+        sum(rollup.get('sessions', 0) for rollup in rollups)
+    )
+
+
+def daily_totals(rollups):
+    """[{date, attendance, sessions, students}] with rollups of the same day combined"""
+    days = defaultdict(lambda: {'attendance': 0, 'sessions': 0, 'students': 0})
+    for rollup in rollups:
+        day = days[rollup['date']]
+        day['attendance'] += rollup.get('attendance', 0)
+        day['sessions'] += rollup.get('sessions', 0)
+        day['students'] += sum(1 for count in (rollup.get('students') or {}).values() if count > 0)
+    return [dict(day, date=date) for date, day in sorted(days.items())]
+
+
+def student_totals(rollups):
+    """Counter of attendance per student over rollups"""
+    counts = Counter()
+    for rollup in rollups:
+        for student_id, count in (rollup.get('students') or {}).items():
+            counts[student_id] += count
+    return counts
+
+
+def delete_course_rollups(course_id):
+    """Delete every daily rollup of a course"""
+    batch = db.batch()
+    for rollup in db.collection(COLLECTION).where('course_id', '==', course_id).select([]).stream():
+        batch.delete(rollup.reference)
+        if len(batch) >= MAX_BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+
+
+def backfill_rollups(client=None):
+    """Recompute every daily rollup from the raw attendance records and sessions"""
+    client = client or db
+    rollups = {}
+
+    def rollup_for(course_id, moment, student_id=None):
+        date = _date_key(moment)
+        key = _attendance_shard_id(course_id, date, student_id) if student_id else _rollup_id(course_id, date)
+        if key not in rollups:
+            rollups[key] = {'course_id': course_id, 'date': date, 'attendance': 0, 'sessions': 0, 'students': Counter()}
+        return rollups[key]
+
+    for record in client.collection('attendance').select(['course_id', 'student_id', 'timestamp']).stream():
+        record_data = record.to_dict()
+        if record_data.get('timestamp'):
+            rollup = rollup_for(record_data['course_id'], record_data['timestamp'], record_data['student_id'])
+            rollup['attendance'] += 1
+            rollup['students'][record_data['student_id']] += 1
+
+    for session in client.collection('attendance_sessions').select(['course_id', 'created_at']).stream():
+        session_data = session.to_dict()
+        if session_data.get('created_at'):
+            rollup_for(session_data['course_id'], session_data['created_at'])['sessions'] += 1
+
+    batch = client.batch()
+    for rollup in client.collection(COLLECTION).select([]).stream():
+        if rollup.id not in rollups:
+            batch.delete(rollup.reference)
+            if len(batch) >= MAX_BATCH_SIZE:
+                batch.commit()
+                batch = client.batch()
+
+    for document_id, rollup in rollups.items():
+        batch.set(client.collection(COLLECTION).document(document_id), dict(rollup, students=dict(rollup['students'])))
+        if len(batch) >= MAX_BATCH_SIZE:
+            batch.commit()
+            batch = client.batch()
+    batch.commit()
+
+    return len(rollups)
+
+
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    """Recompute daily course rollups from raw attendance records and sessions."""
+    print(f'Wrote {backfill_rollups()} daily rollups')
@@ -1,10 +1,26 @@
-from flask import render_template, request, jsonify, session, redirect
+from flask import render_template, request, jsonify, session, redirect, Response, stream_with_context
 from app import app, db, bucket
+import metrics
 from auth import login_required, role_required
-from models import generate_qr_code, validate_attendance
+from models import generate_qr_code, validate_attendance, attendance_id, add_attendance_writes, get_session, is_session_open, add_to_roster, remove_from_rosters, roster_cache
 from analytics import analytics
 from reports import report_generator
+from loader import get_loader
+import counters
+import summaries
+import rollups
+import system_stats
+import migrations
+import sweeper
+from columnar import attendance_columns
+from live import live_hub, format_event, serialize_attendee, DROPPED
+from writebehind import write_queue, CoalescingBatch, WRITES_PER_ENTRY
+from tokens import verify_qr_token, token_session_id, verify_scan_signature
+from admission import admission_required
+import queue
+from collections import Counter
 from datetime import datetime, timedelta
+from datastore import AlreadyExists, MAX_BATCH_SIZE, commit_with_retry
 import uuid
 from firebase_admin import auth
 
@@ -25,33 +41,37 @@ def index():
 def student_dashboard():
     user = session['user']
     
+    loader = get_loader()
+    
     # Get enrolled courses with additional info
     enrollments = db.collection('enrollments').where('student_id', '==', user['uid']).stream()
+    course_ids = [enrollment.to_dict()['course_id'] for enrollment in enrollments]
+    
+    # Get attendance history, priming its courses into the same batched lookup
+    attendance_records = list(db.collection('attendance').where('student_id', '==', user['uid']).order_by('timestamp', direction='DESCENDING').limit(20).stream())
+    loader.prime('courses', [record.to_dict()['course_id'] for record in attendance_records])
+    course_docs = loader.load_many('courses', course_ids)
+    
+    # Get lecturer names for all courses at once
+    lecturers = loader.load_many('users', [course['lecturer_id'] for course in course_docs.values()])
+    attendance_counts = counters.student_course_counts(user['uid'], list(course_docs))
     courses = []
     
-    for enrollment in enrollments:
-        course_id = enrollment.to_dict()['course_id']
-        course_doc = db.collection('courses').document(course_id).get()
-        if course_doc.exists:
-            course_data = course_doc.to_dict()
+    for course_id in course_ids:
+        if course_id in course_docs:
+            course_data = course_docs[course_id]
             course_data['id'] = course_id
             
             # Get lecturer name
-            lecturer_doc = db.collection('users').document(course_data['lecturer_id']).get()
-            if lecturer_doc.exists:
-                course_data['lecturer_name'] = lecturer_doc.to_dict().get('name', 'Unknown')
+            lecturer_data = lecturers.get(course_data['lecturer_id'])
+            if lecturer_data:
+                course_data['lecturer_name'] = lecturer_data.get('name', 'Unknown')
             
             # Get attendance count for this course
-            attendance_count = len(list(db.collection('attendance')
-                                      .where('student_id', '==', user['uid'])
-                                      .where('course_id', '==', course_id)
-                                      .stream()))
-            course_data['attendance_count'] = attendance_count
+            course_data['attendance_count'] = attendance_counts[course_id]
             
             courses.append(course_data)
     
-    # Get attendance history with course info
-    attendance_records = db.collection('attendance').where('student_id', '==', user['uid']).order_by('timestamp', direction='DESCENDING').limit(20).stream()
     attendance = []
     
     for record in attendance_records:
@@ -59,9 +79,8 @@ def student_dashboard():
         attendance_data['id'] = record.id
         
         # Get course info
-        course_doc = db.collection('courses').document(attendance_data['course_id']).get()
-        if course_doc.exists:
-            course_info = course_doc.to_dict()
+        course_info = loader.load('courses', attendance_data['course_id'])
+        if course_info:
             attendance_data['course_name'] = course_info.get('name', 'Unknown Course')
             attendance_data['course_code'] = course_info.get('code', '')
         
@@ -75,18 +94,14 @@ def lecturer_dashboard():
     user = session['user']
     
     # Get lecturer's courses
-    courses = db.collection('courses').where('lecturer_id', '==', user['uid']).stream()
+    courses = list(db.collection('courses').where('lecturer_id', '==', user['uid']).stream())
+    enrollment_counts = counters.enrollment_counts([course.id for course in courses])
     course_list = []
     
     for course in courses:
         course_data = course.to_dict()
         course_data['id'] = course.id
-        
-        # Get enrollment count
-        enrollment_count = len(list(db.collection('enrollments')
-                                  .where('course_id', '==', course.id)
-                                  .stream()))
-        course_data['enrollment_count'] = enrollment_count
+        course_data['enrollment_count'] = enrollment_counts[course.id]
         
         # Get recent sessions count
         recent_sessions = len(list(db.collection('attendance_sessions')
@@ -112,7 +127,9 @@ def admin_dashboard():
         pending_list.append(user_data)
     
     # Get all courses with stats
-    courses = db.collection('courses').stream()
+    courses = list(db.collection('courses').stream())
+    lecturers = get_loader().load_many('users', [course.to_dict()['lecturer_id'] for course in courses])
+    enrollment_counts = counters.enrollment_counts([course.id for course in courses])
     course_list = []
     
     for course in courses:
@@ -120,27 +137,21 @@ def admin_dashboard():
         course_data['id'] = course.id
         
         # Get lecturer name
-        lecturer_doc = db.collection('users').document(course_data['lecturer_id']).get()
-        if lecturer_doc.exists:
-            course_data['lecturer_name'] = lecturer_doc.to_dict().get('name', 'Unknown')
+        lecturer_data = lecturers.get(course_data['lecturer_id'])
+        if lecturer_data:
+            course_data['lecturer_name'] = lecturer_data.get('name', 'Unknown')
         
-        # Get enrollment count
-        enrollment_count = len(list(db.collection('enrollments')
-                                  .where('course_id', '==', course.id)
-                                  .stream()))
-        course_data['enrollment_count'] = enrollment_count
+        course_data['enrollment_count'] = enrollment_counts[course.id]
         
         course_list.append(course_data)
     
     # Get system stats
-    total_users = len(list(db.collection('users').stream()))
-    total_students = len(list(db.collection('users').where('role', '==', 'student').stream()))
-    total_lecturers = len(list(db.collection('users').where('role', '==', 'lecturer').stream()))
+    system_totals = system_stats.get_system_stats()
     
     stats = {
-        'total_users': total_users,
-        'total_students': total_students,
-        'total_lecturers': total_lecturers,
+        'total_users': system_totals['total_users'],
+        'total_students': system_totals['total_students'],
+        'total_lecturers': system_totals['total_lecturers'],
         'total_courses': len(course_list),
         'pending_approvals': len(pending_list)
     }
@@ -150,8 +161,13 @@ def admin_dashboard():
                          courses=course_list,
                          stats=stats)
 
+def _scan_session_key():
+    """Admission key for a scan: the session its QR code names"""
+    return token_session_id((request.get_json(silent=True) or {}).get('qr_data'))
+
 @app.route('/api/mark-attendance', methods=['POST'])
 @role_required('student')
+@admission_required(_scan_session_key)
 def mark_attendance():
     try:
         data = request.json
@@ -162,7 +178,7 @@ def mark_attendance():
         result = validate_attendance(qr_data, student_id)
         
         if result['valid']:
-            # Record attendance
+            # Record attendance together with its counters
             attendance_data = {
                 'student_id': student_id,
                 'course_id': result['course_id'],
@@ -172,11 +188,27 @@ def mark_attendance():
                 'student_name': session['user']['name']
             }
             
-            db.collection('attendance').add(attendance_data)
+            if write_queue is not None:
+                # Acknowledge once journaled locally; the flusher writes it in a batch
+                if not write_queue.enqueue(attendance_id(result['session_id'], student_id), attendance_data, result['summary_shards']):
+                    return jsonify({'success': False, 'message': 'Attendance already marked for this session', 'duplicate': True}), 400
+            else:
+                # The create fails if this student is already recorded for the session
+                batch = db.batch()
+                add_attendance_writes(batch, attendance_data, result['summary_shards'])
+                try:
+                    commit_with_retry(batch)
+                except AlreadyExists:
+                    return jsonify({'success': False, 'message': 'Attendance already marked for this session', 'duplicate': True}), 400
+                
+                live_hub.publish(result['session_id'], attendance_data)
+                analytics.invalidate(student_id, result['course_id'])
             
-            # Get course name for response
-            course_doc = db.collection('courses').document(result['course_id']).get()
-            course_name = course_doc.to_dict().get('name', 'Course') if course_doc.exists else 'Course'
+            # Sessions carry the course name; older ones fall back to a read
+            course_name = result.get('course_name')
+            if course_name is None:
+                course_doc = db.collection('courses').document(result['course_id']).get()
+                course_name = course_doc.to_dict().get('name', 'Course') if course_doc.exists else 'Course'
             
             return jsonify({
                 'success': True, 
@@ -188,6 +220,165 @@ def mark_attendance():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _parse_scan_time(value):
+    """POSIX seconds from an ISO 8601 string or JavaScript epoch milliseconds"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    raise ValueError('Missing scan time')
+
+@app.route('/api/mark-attendance/bulk', methods=['POST'])
+@role_required('any')
+@admission_required()
+def mark_attendance_bulk():
+    """Record scans collected offline by a student's or lecturer's device"""
+    try:
+        user = session['user']
+        role = user.get('role', 'student')
+        if role not in ('student', 'lecturer'):
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+        
+        events = (request.json or {}).get('scans')
+        if not isinstance(events, list) or not events:
+            return jsonify({'success': False, 'message': 'No scans provided'}), 400
+        if len(events) > app.config['BULK_SCAN_LIMIT']:
+            return jsonify({'success': False, 'message': f"At most {app.config['BULK_SCAN_LIMIT']} scans per upload"}), 400
+        
+        now = datetime.now().timestamp()
+        results = [None] * len(events)
+        candidates = []
+        
+        # Check signatures and scan times first, so lookups are only made for real sessions
+        for index, event in enumerate(events):
+            event = event if isinstance(event, dict) else {}
+            student_id = event.get('student_id') if role == 'lecturer' else user['uid']
+            if not student_id or (role == 'student' and event.get('student_id') not in (None, student_id)):
+                results[index] = {'success': False, 'message': 'Invalid student'}
+                continue
+            
+            try:
+                scanned_at = _parse_scan_time(event.get('scanned_at'))
+            except (TypeError, ValueError):
+                results[index] = {'success': False, 'message': 'Invalid scan time'}
+                continue
+            
+            # Only scan times signed with the session's scan key are trusted further back than the grace period
+            if event.get('signature') is not None:
+                if not verify_scan_signature(token_session_id(event.get('qr_data')), student_id, event.get('scanned_at'), event['signature']):
+                    results[index] = {'success': False, 'message': 'Invalid scan signature'}
+                    continue
+            else:
+                scanned_at = max(scanned_at, now - app.config['OFFLINE_SCAN_GRACE'])
+            
+            # Client clocks may run ahead; a scan cannot be from the future
+            scanned_at = min(scanned_at, now)
+            
+            token = verify_qr_token(event.get('qr_data'), now=scanned_at)
+            if not token['valid']:
+                results[index] = {'success': False, 'message': token['message']}
+                continue
+            candidates.append((index, student_id, scanned_at, token))
+        
+        # Fetch every session, course and student the upload refers to in one read each
+        loader = get_loader()
+        loader.prime('attendance_sessions', {token['session_id'] for _, _, _, token in candidates})
+        if role == 'lecturer':
+            owned = {course_id for course_id, course_data in loader.load_many('courses', {token['course_id'] for _, _, _, token in candidates}).items()
+                     if course_data.get('lecturer_id') == user['uid']}
+            students = loader.load_many('users', {student_id for _, student_id, _, _ in candidates})
+        
+        accepted = {}
+        for index, student_id, scanned_at, token in candidates:
+            if role == 'lecturer' and token['course_id'] not in owned:
+                results[index] = {'success': False, 'message': 'Unauthorized'}
+                continue
+            
+            result = validate_attendance(events[index]['qr_data'], student_id, at=scanned_at)
+            if not result['valid']:
+                results[index] = {'success': False, 'message': result['message']}
+                continue
+            
+            document_id = attendance_id(result['session_id'], student_id)
+            if document_id in accepted:
+                results[index] = {'success': False, 'message': 'Attendance already marked for this session'}
+                continue
+            
+            student_name = user['name'] if role == 'student' else students.get(student_id, {}).get('name', 'Unknown')
+            accepted[document_id] = (index, {
+                'student_id': student_id,
+                'course_id': result['course_id'],
+                'session_id': result['session_id'],
+                'timestamp': datetime.fromtimestamp(scanned_at),
+                'marked_by': 'offline_scan',
+                'student_name': student_name
+            }, result['summary_shards'])
+        
+        # Scans recorded by an earlier upload or a live scan are duplicates
+        existing = loader.load_many('attendance', list(accepted))
+        pending = []
+        for document_id, (index, attendance_data, shards) in accepted.items():
+            if document_id in existing:
+                results[index] = {'success': False, 'message': 'Attendance already marked for this session'}
+            else:
+                pending.append((document_id, index, attendance_data, shards))
+        
+        if write_queue is not None:
+            for document_id, index, attendance_data, shards in pending:
+                if write_queue.enqueue(document_id, attendance_data, shards):
+                    results[index] = {'success': True, 'message': 'Attendance recorded'}
+                else:
+                    results[index] = {'success': False, 'message': 'Attendance already marked for this session'}
+        else:
+            _commit_scans(pending, results)
+        
+        # Backdated scans fall behind the analytics columns' watermark
+        if attendance_columns is not None and pending:
+            attendance_columns.invalidate(min(attendance_data['timestamp'] for _, _, attendance_data, _ in pending))
+        
+        recorded = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': True,
+            'recorded': recorded,
+            'results': results
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def _commit_scans(pending, results):
+    """Write accepted scans with as few batched commits as possible"""
+    start = 0
+    while start < len(pending):
+        batch = CoalescingBatch(db)
+        end = start
+        while end < len(pending) and len(batch) + WRITES_PER_ENTRY <= MAX_BATCH_SIZE:
+            _, _, attendance_data, shards = pending[end]
+            add_attendance_writes(batch, attendance_data, shards)
+            end += 1
+        chunk = pending[start:end]
+        
+        try:
+            commit_with_retry(batch)
+            written = chunk
+        except AlreadyExists:
+            # A live scan landed meanwhile; fall back to one commit per scan for this chunk
+            written = []
+            for entry in chunk:
+                single = db.batch()
+                add_attendance_writes(single, entry[2], entry[3])
+                try:
+                    commit_with_retry(single)
+                    written.append(entry)
+                except AlreadyExists:
+                    results[entry[1]] = {'success': False, 'message': 'Attendance already marked for this session'}
+        
+        for _, index, attendance_data, _ in written:
+            results[index] = {'success': True, 'message': 'Attendance recorded'}
+            live_hub.publish(attendance_data['session_id'], attendance_data)
+            analytics.invalidate(attendance_data['student_id'], attendance_data['course_id'])
+        start = end
+
 @app.route('/api/generate-qr', methods=['POST'])
 @role_required('lecturer')
 def generate_qr():
@@ -202,13 +393,15 @@ def generate_qr():
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
         # Generate QR code
-        qr_result = generate_qr_code(course_id, session['user']['uid'], duration)
+        qr_result = generate_qr_code(course_id, session['user']['uid'], duration, course_doc.to_dict().get('name'))
+        analytics.invalidate(course_id=course_id)
         
         return jsonify({
             'success': True,
             'qr_code': qr_result['qr_code'],
             'session_id': qr_result['session_id'],
-            'expires_at': qr_result['expires_at'].isoformat()
+            'expires_at': qr_result['expires_at'].isoformat(),
+            'scan_key': qr_result['scan_key']
         })
         
     except Exception as e:
@@ -227,8 +420,12 @@ def create_course():
             'created_at': datetime.now()
         }
         
-        course_ref = db.collection('courses').add(course_data)
-        return jsonify({'success': True, 'course_id': course_ref[1].id})
+        course_ref = db.collection('courses').document()
+        batch = db.batch()
+        batch.set(course_ref, course_data)
+        system_stats.adjust(batch, total_courses=1)
+        batch.commit()
+        return jsonify({'success': True, 'course_id': course_ref.id})
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -268,7 +465,13 @@ def enroll_student():
             'enrolled_by': session['user']['uid']
         }
         
-        db.collection('enrollments').add(enrollment_data)
+        batch = db.batch()
+        batch.set(db.collection('enrollments').document(), enrollment_data)
+        counters.record_enrollment(batch, course_id)
+        system_stats.adjust(batch, total_enrollments=1)
+        batch.commit()
+        add_to_roster(course_id, student_id)
+        analytics.invalidate(student_id, course_id)
         return jsonify({'success': True, 'message': 'Student enrolled successfully'})
         
     except Exception as e:
@@ -279,35 +482,94 @@ def enroll_student():
 def get_live_attendance(session_id):
     try:
         # Verify session belongs to lecturer
-        session_doc = db.collection('attendance_sessions').document(session_id).get()
-        if not session_doc.exists:
+        session_data = get_session(session_id)
+        if session_data is None:
             return jsonify({'success': False, 'message': 'Session not found'}), 404
         
-        session_data = session_doc.to_dict()
         if session_data['lecturer_id'] != session['user']['uid']:
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
-        # Get attendance records for this session
-        attendance_records = db.collection('attendance').where('session_id', '==', session_id).stream()
+        # The session counter changes whenever someone scans, so it versions the roster
+        attendance_count = counters.session_counts([session_id])[session_id]
+        session_active = is_session_open(session_data)
+        etag = f'W/"{session_id}-{attendance_count}-{int(session_active)}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=304, headers={'ETag': etag})
+        
+        since = request.args.get('since')
+        if since:
+            try:
+                since = datetime.fromisoformat(since)
+            except ValueError:
+                return jsonify({'success': False, 'message': 'Invalid since cursor'}), 400
+        
+        # Read the session summary and return only attendees from the client's cursor on
         attendance_list = []
-        
-        for record in attendance_records:
-            record_data = record.to_dict()
-            attendance_list.append({
-                'student_id': record_data['student_id'],
-                'student_name': record_data.get('student_name', 'Unknown'),
-                'timestamp': record_data['timestamp'].isoformat() if record_data.get('timestamp') else None
-            })
-        
-        return jsonify({
+        cursor = since
+        
+        for attendee in summaries.get_attendees(session_id, session_data.get('summary_shards', 1)):
+            timestamp = attendee['timestamp']
+            # Inclusive so attendees sharing the cursor's timestamp are not missed
+            if since and (timestamp is None or timestamp < since):
+                continue
+            attendance_list.append(serialize_attendee(attendee))
+            if timestamp and (cursor is None or timestamp > cursor):
+                cursor = timestamp
+        
+        response = jsonify({
             'success': True,
             'attendance': attendance_list,
-            'session_active': session_data.get('active', False)
+            'cursor': cursor.isoformat() if cursor else None,
+            'session_active': session_active
         })
+        response.headers['ETag'] = etag
+        return response
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/live-attendance/<session_id>/stream')
+@role_required('lecturer')
+def stream_live_attendance(session_id):
+    """Server-Sent Events feed of attendees as they scan"""
+    session_data = get_session(session_id)
+    if session_data is None:
+        return jsonify({'success': False, 'message': 'Session not found'}), 404
+    
+    if session_data['lecturer_id'] != session['user']['uid']:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    listener, snapshot = live_hub.subscribe(session_id, session_data.get('summary_shards', 1))
+    expires_at = session_data['expires_at']
+    session_active = is_session_open(session_data)
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            yield format_event('snapshot', {'attendance': snapshot, 'session_active': session_active})
+            
+            while session_active and datetime.now(expires_at.tzinfo) < expires_at:
+                try:
+                    attendee = listener.get(timeout=15)
+                except queue.Empty:
+                    # Keep proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                if attendee is DROPPED:
+                    # Fell too far behind; closing lets EventSource reconnect with a fresh snapshot
+                    return
+                yield format_event('attendee', attendee)
+            
+            yield format_event('end', {'session_active': False})
+        finally:
+            live_hub.unsubscribe(session_id, listener)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/course-stats/<course_id>')
 @role_required('lecturer')
 def get_course_stats(course_id):
@@ -326,8 +588,7 @@ def get_course_stats(course_id):
         session_count = len(sessions)
         
         # Get total attendance records
-        attendance_records = list(db.collection('attendance').where('course_id', '==', course_id).stream())
-        attendance_count = len(attendance_records)
+        attendance_count = counters.course_count(course_id)
         
         # Calculate average attendance rate
         avg_attendance_rate = 0
@@ -357,30 +618,24 @@ def get_enrolled_students(course_id):
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
         # Get enrolled students
-        enrollments = db.collection('enrollments').where('course_id', '==', course_id).stream()
+        enrollments = [enrollment.to_dict() for enrollment in db.collection('enrollments').where('course_id', '==', course_id).stream()]
+        student_docs = get_loader().load_many('users', [enrollment['student_id'] for enrollment in enrollments])
+        attendance_counts = counters.course_student_counts(course_id, list(student_docs))
         students = []
         
-        for enrollment in enrollments:
-            enrollment_data = enrollment.to_dict()
+        for enrollment_data in enrollments:
             student_id = enrollment_data['student_id']
             
             # Get student details
-            student_doc = db.collection('users').document(student_id).get()
-            if student_doc.exists:
-                student_data = student_doc.to_dict()
-                
-                # Get attendance count for this student in this course
-                attendance_count = len(list(db.collection('attendance')
-                                          .where('student_id', '==', student_id)
-                                          .where('course_id', '==', course_id)
-                                          .stream()))
+            student_data = student_docs.get(student_id)
+            if student_data:
                 
                 students.append({
                     'id': student_id,
                     'name': student_data.get('name', 'Unknown'),
                     'email': student_data.get('email', 'Unknown'),
                     'enrolled_at': enrollment_data.get('enrolled_at'),
-                    'attendance_count': attendance_count
+                    'attendance_count': attendance_counts[student_id]
                 })
         
         return jsonify({
@@ -402,11 +657,15 @@ def approve_user(user_id):
         if not user_doc.exists:
             return jsonify({'success': False, 'message': 'User not found'}), 404
         
-        user_ref.update({
+        batch = db.batch()
+        batch.update(user_ref, {
             'approved': True,
             'approved_at': datetime.now(),
             'approved_by': session['user']['uid']
         })
+        if not user_doc.to_dict().get('approved', False):
+            system_stats.adjust(batch, pending_approvals=-1)
+        batch.commit()
         
         return jsonify({'success': True, 'message': 'User approved successfully'})
         
@@ -431,7 +690,10 @@ def reject_user(user_id):
             print(f"Error deleting from Firebase Auth: {auth_error}")
         
         # Delete from Firestore
-        user_ref.delete()
+        batch = db.batch()
+        batch.delete(user_ref)
+        system_stats.adjust(batch, **system_stats.user_deltas(user_doc.to_dict(), -1))
+        batch.commit()
         
         return jsonify({'success': True, 'message': 'User rejected and deleted'})
         
@@ -466,7 +728,10 @@ def admin_create_user():
             'created_by': session['user']['uid']
         }
         
-        db.collection('users').document(user_record.uid).set(user_data)
+        batch = db.batch()
+        batch.set(db.collection('users').document(user_record.uid), user_data)
+        system_stats.adjust(batch, **system_stats.user_deltas(user_data))
+        batch.commit()
         
         return jsonify({'success': True, 'message': 'User created successfully'})
         
@@ -506,7 +771,7 @@ def get_user_details(user_id):
         if user_data['role'] == 'student':
             # Get enrollment and attendance stats
             enrollments = len(list(db.collection('enrollments').where('student_id', '==', user_id).stream()))
-            attendance_records = len(list(db.collection('attendance').where('student_id', '==', user_id).stream()))
+            attendance_records = counters.student_count(user_id)
             user_data['enrollments'] = enrollments
             user_data['attendance_records'] = attendance_records
             
@@ -537,15 +802,19 @@ def admin_delete_user(user_id):
         user_data = user_doc.to_dict()
         
         # Delete related data based on role
+        deltas = system_stats.user_deltas(user_data, -1)
+        enrollment_deltas = Counter()
         if user_data['role'] == 'student':
+            remove_from_rosters(user_id)
+            
             # Delete enrollments and attendance records
             enrollments = db.collection('enrollments').where('student_id', '==', user_id).stream()
             for enrollment in enrollments:
                 enrollment.reference.delete()
+                enrollment_deltas[enrollment.to_dict()['course_id']] -= 1
+                deltas['total_enrollments'] = deltas.get('total_enrollments', 0) - 1
             
-            attendance_records = db.collection('attendance').where('student_id', '==', user_id).stream()
-            for record in attendance_records:
-                record.reference.delete()
+            counters.delete_attendance(db.collection('attendance').where('student_id', '==', user_id).stream())
                 
         elif user_data['role'] == 'lecturer':
             # Delete courses, sessions, and related data
@@ -554,22 +823,31 @@ def admin_delete_user(user_id):
                 course_id = course.id
                 
                 # Delete enrollments for this course
+                roster_cache.invalidate(course_id)
                 enrollments = db.collection('enrollments').where('course_id', '==', course_id).stream()
                 for enrollment in enrollments:
                     enrollment.reference.delete()
+                    enrollment_deltas[course_id] -= 1
+                    deltas['total_enrollments'] = deltas.get('total_enrollments', 0) - 1
                 
                 # Delete attendance records for this course
-                attendance_records = db.collection('attendance').where('course_id', '==', course_id).stream()
-                for record in attendance_records:
-                    record.reference.delete()
+                counters.delete_attendance(db.collection('attendance').where('course_id', '==', course_id).stream())
                 
                 # Delete sessions for this course
                 sessions = db.collection('attendance_sessions').where('course_id', '==', course_id).stream()
                 for session_doc in sessions:
+                    summaries.delete_summaries(session_doc.id, session_doc.to_dict().get('summary_shards', 1))
                     session_doc.reference.delete()
+                rollups.delete_course_rollups(course_id)
                 
                 # Delete the course
                 course.reference.delete()
+                deltas['total_courses'] = deltas.get('total_courses', 0) - 1
+        
+        # Deleted records cannot be picked up incrementally
+        if attendance_columns is not None:
+            attendance_columns.invalidate()
+        analytics.invalidate()
         
         # Delete from Firebase Auth
         try:
@@ -578,7 +856,12 @@ def admin_delete_user(user_id):
             print(f"Error deleting from Firebase Auth: {auth_error}")
         
         # Delete user document
-        db.collection('users').document(user_id).delete()
+        batch = db.batch()
+        batch.delete(db.collection('users').document(user_id))
+        for course_id, delta in enrollment_deltas.items():
+            counters.record_enrollment(batch, course_id, delta)
+        system_stats.adjust(batch, **deltas)
+        batch.commit()
         
         return jsonify({'success': True, 'message': 'User and related data deleted successfully'})
         
@@ -594,22 +877,32 @@ def admin_delete_course(course_id):
             return jsonify({'success': False, 'message': 'Course not found'}), 404
         
         # Delete enrollments
+        roster_cache.invalidate(course_id)
         enrollments = db.collection('enrollments').where('course_id', '==', course_id).stream()
+        removed_enrollments = 0
         for enrollment in enrollments:
             enrollment.reference.delete()
+            removed_enrollments += 1
         
         # Delete attendance records
-        attendance_records = db.collection('attendance').where('course_id', '==', course_id).stream()
-        for record in attendance_records:
-            record.reference.delete()
+        counters.delete_attendance(db.collection('attendance').where('course_id', '==', course_id).stream())
         
         # Delete sessions
         sessions = db.collection('attendance_sessions').where('course_id', '==', course_id).stream()
         for session in sessions:
+            summaries.delete_summaries(session.id, session.to_dict().get('summary_shards', 1))
             session.reference.delete()
+        rollups.delete_course_rollups(course_id)
+        if attendance_columns is not None:
+            attendance_columns.invalidate()
+        analytics.invalidate()
         
         # Delete the course
-        db.collection('courses').document(course_id).delete()
+        batch = db.batch()
+        batch.delete(db.collection('courses').document(course_id))
+        counters.record_enrollment(batch, course_id, -removed_enrollments)
+        system_stats.adjust(batch, total_courses=-1, total_enrollments=-removed_enrollments)
+        batch.commit()
         
         return jsonify({'success': True, 'message': 'Course and related data deleted successfully'})
         
@@ -632,19 +925,21 @@ def export_system_report():
         writer.writerow(['Generated At', datetime.now().isoformat()])
         writer.writerow([])
         
+        system_totals = system_stats.get_system_stats()
+        
         # User statistics
         writer.writerow(['User Statistics'])
-        writer.writerow(['Total Users', len(list(db.collection('users').stream()))])
-        writer.writerow(['Students', len(list(db.collection('users').where('role', '==', 'student').stream()))])
-        writer.writerow(['Lecturers', len(list(db.collection('users').where('role', '==', 'lecturer').stream()))])
-        writer.writerow(['Admins', len(list(db.collection('users').where('role', '==', 'admin').stream()))])
+        writer.writerow(['Total Users', system_totals['total_users']])
+        writer.writerow(['Students', system_totals['total_students']])
+        writer.writerow(['Lecturers', system_totals['total_lecturers']])
+        writer.writerow(['Admins', system_totals['total_admins']])
         writer.writerow([])
         
         # Course statistics
         writer.writerow(['Course Statistics'])
-        writer.writerow(['Total Courses', len(list(db.collection('courses').stream()))])
-        writer.writerow(['Total Enrollments', len(list(db.collection('enrollments').stream()))])
-        writer.writerow(['Total Attendance Records', len(list(db.collection('attendance').stream()))])
+        writer.writerow(['Total Courses', system_totals['total_courses']])
+        writer.writerow(['Total Enrollments', system_totals['total_enrollments']])
+        writer.writerow(['Total Attendance Records', system_totals['total_attendance']])
         
         # Create response
         from flask import Response
@@ -658,6 +953,14 @@ def export_system_report():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus-style backend usage counters per route"""
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'success': False, 'message': 'Metrics are disabled'}), 404
+    
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 # Analytics and Reports API endpoints
 
 @app.route('/api/analytics/student/<student_id>')
@@ -734,8 +1037,9 @@ def generate_student_report_api(student_id):
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
         format_type = request.args.get('format', 'csv')
+        pretty = request.args.get('pretty', '').lower() in ('1', 'true')
         
-        report = report_generator.generate_student_report(student_id, format_type)
+        report = report_generator.generate_student_report(student_id, format_type, pretty)
         
         if report:
             return report
@@ -759,8 +1063,9 @@ def generate_course_report_api(course_id):
             return jsonify({'success': False, 'message': 'Unauthorized'}), 403
         
         format_type = request.args.get('format', 'csv')
+        pretty = request.args.get('pretty', '').lower() in ('1', 'true')
         
-        report = report_generator.generate_course_report(course_id, lecturer_id, format_type)
+        report = report_generator.generate_course_report(course_id, lecturer_id, format_type, pretty)
         
         if report:
             return report
@@ -776,8 +1081,9 @@ def generate_system_report_api():
     """Generate system report"""
     try:
         format_type = request.args.get('format', 'csv')
+        pretty = request.args.get('pretty', '').lower() in ('1', 'true')
         
-        report = report_generator.generate_system_report(format_type)
+        report = report_generator.generate_system_report(format_type, pretty)
         
         if report:
             return report
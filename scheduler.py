@@ -0,0 +1,34 @@
+import threading
+
+_jobs = {}
+_lock = threading.Lock()
+
+
+def every(name, interval_seconds, fn):
+    """Run fn every interval_seconds on a daemon thread (once per process)"""
+    with _lock:
+        if name in _jobs or not interval_seconds:
+            return None
+
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval_seconds):
+                try:
+                    fn()
+                except Exception as e:
+                    print(f"Error in scheduled job {name}: {e}")
+
+        thread = threading.Thread(target=run, name=f'job-{name}', daemon=True)
+        _jobs[name] = (thread, stop)
+        thread.start()
+        return thread
+
+
+def cancel(name):
+    """Stop a scheduled job"""
+    with _lock:
+        job = _jobs.pop(name, None)
+    if job:
+        job[1].set()
+
@@ -0,0 +1,54 @@
+import threading
+
+
+class _Call:
+    """One in-flight execution and the result its waiters will receive"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait up to ``timeout`` seconds and receive its result (or its
+    exception). Nothing is kept once the call finishes.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(timeout if timeout is not None else self.timeout):
+            raise TimeoutError(f'Timed out waiting for an identical request in progress: {key!r}')
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -1,6 +1,8 @@
 // Lecturer dashboard functionality
 let currentSession = null
 let liveAttendanceInterval = null
+let liveAttendanceSource = null
+let livePollState = null
 const bootstrap = window.bootstrap // Declare the bootstrap variable
 
 function initializeLecturerDashboard() {
@@ -105,10 +107,47 @@ function displayQRCode(qrData, courseName) {
 }
 
 function startLiveAttendanceTracking(sessionId) {
-  // Clear any existing interval
-  if (liveAttendanceInterval) {
-    clearInterval(liveAttendanceInterval)
+  stopLiveAttendanceTracking()
+
+  // Prefer the push stream; fall back to polling where it is unavailable
+  if (window.EventSource) {
+    startLiveAttendanceStream(sessionId)
+  } else {
+    startLiveAttendancePolling(sessionId)
+  }
+}
+
+function startLiveAttendanceStream(sessionId) {
+  let attendanceList = []
+  const source = new EventSource(`/api/live-attendance/${sessionId}/stream`)
+  liveAttendanceSource = source
+
+  source.addEventListener("snapshot", (event) => {
+    attendanceList = JSON.parse(event.data).attendance
+    renderLiveAttendance(attendanceList)
+  })
+
+  source.addEventListener("attendee", (event) => {
+    attendanceList.push(JSON.parse(event.data))
+    renderLiveAttendance(attendanceList)
+  })
+
+  source.addEventListener("end", () => {
+    source.close()
+    liveAttendanceSource = null
+  })
+
+  source.onerror = () => {
+    // EventSource retries on its own; only fall back once it has given up
+    if (source.readyState === EventSource.CLOSED && liveAttendanceSource === source) {
+      liveAttendanceSource = null
+      startLiveAttendancePolling(sessionId)
+    }
   }
+}
+
+function startLiveAttendancePolling(sessionId) {
+  livePollState = { sessionId: sessionId, cursor: null, etag: null, attendance: [] }
 
   // Update live attendance every 5 seconds
   liveAttendanceInterval = setInterval(() => {
@@ -119,14 +158,57 @@ function startLiveAttendanceTracking(sessionId) {
   updateLiveAttendance(sessionId)
 }
 
+function stopLiveAttendanceTracking() {
+  if (liveAttendanceSource) {
+    liveAttendanceSource.close()
+    liveAttendanceSource = null
+  }
+
+  if (liveAttendanceInterval) {
+    clearInterval(liveAttendanceInterval)
+    liveAttendanceInterval = null
+  }
+
+  livePollState = null
+}
+
+function renderLiveAttendance(attendanceList) {
+  displayLiveAttendance(attendanceList)
+  document.getElementById("liveCount").textContent = `${attendanceList.length} students`
+}
+
 async function updateLiveAttendance(sessionId) {
+  const state = livePollState
+  if (!state || state.sessionId !== sessionId) {
+    return
+  }
+
   try {
-    const response = await fetch(`/api/live-attendance/${sessionId}`)
+    // Ask only for attendees since the last poll; 304 means nothing changed
+    const url = state.cursor
+      ? `/api/live-attendance/${sessionId}?since=${encodeURIComponent(state.cursor)}`
+      : `/api/live-attendance/${sessionId}`
+    const headers = state.etag ? { "If-None-Match": state.etag } : {}
+    const response = await fetch(url, { headers: headers })
+
+    if (response.status === 304) {
+      return
+    }
+
     const data = await response.json()
 
     if (data.success) {
-      displayLiveAttendance(data.attendance)
-      document.getElementById("liveCount").textContent = `${data.attendance.length} students`
+      state.etag = response.headers.get("ETag")
+      state.cursor = data.cursor || state.cursor
+
+      // The cursor is inclusive, so skip attendees already shown
+      const known = new Set(state.attendance.map((record) => record.student_id))
+      const added = data.attendance.filter((record) => !known.has(record.student_id))
+
+      if (added.length > 0 || state.attendance.length === 0) {
+        state.attendance = state.attendance.concat(added)
+        renderLiveAttendance(state.attendance)
+      }
     }
   } catch (error) {
     console.error("Error updating live attendance:", error)
@@ -177,10 +259,7 @@ function displayLiveAttendance(attendanceList) {
 function stopSession() {
   if (currentSession) {
     // Clear live tracking
-    if (liveAttendanceInterval) {
-      clearInterval(liveAttendanceInterval)
-      liveAttendanceInterval = null
-    }
+    stopLiveAttendanceTracking()
 
     // Hide QR container
     document.getElementById("qrCodeContainer").style.display = "none"
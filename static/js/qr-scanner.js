@@ -157,18 +157,13 @@ class QRScanner {
     try {
       this.updateScannerStatus("Processing QR code...", "info")
 
-      const response = await fetch("/api/mark-attendance", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ qr_data: qrData }),
-      })
+      const { response, resent } = await this.postWithRetry("/api/mark-attendance", { qr_data: qrData })
 
       const result = await response.json()
 
-      if (result.success) {
-        this.showSuccess(result.message)
+      // A resent scan is reported as a duplicate when the lost attempt was recorded
+      if (result.success || (resent && result.duplicate)) {
+        this.showSuccess(result.success ? result.message : "Attendance recorded successfully!")
         this.updateScannerStatus("Attendance recorded successfully!", "success")
 
         // Refresh attendance data
@@ -186,6 +181,40 @@ class QRScanner {
     }
   }
 
+  async postWithRetry(url, body, maxAttempts = 5) {
+    // Retry busy (429/503) responses and network errors with capped, jittered backoff,
+    // so students scanning at the start of a lecture do not all retry at once.
+    // resent is true when an earlier attempt failed in transit and may have been processed.
+    let resent = false
+    for (let attempt = 1; ; attempt++) {
+      let response = null
+      try {
+        response = await fetch(url, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          body: JSON.stringify(body),
+        })
+        if ((response.status !== 429 && response.status !== 503) || attempt >= maxAttempts) {
+          return { response, resent }
+        }
+      } catch (error) {
+        if (attempt >= maxAttempts) {
+          throw error
+        }
+        resent = true
+      }
+
+      const retryAfter = response ? Number.parseFloat(response.headers.get("Retry-After")) : NaN
+      const backoff = Math.min(8000, 500 * 2 ** (attempt - 1))
+      const delay = (Number.isFinite(retryAfter) ? retryAfter * 1000 : 0) + Math.random() * backoff
+
+      this.updateScannerStatus("Server busy, retrying...", "info")
+      await new Promise((resolve) => setTimeout(resolve, delay))
+    }
+  }
+
   submitManualQR() {
     const manualInput = document.getElementById("manualQrInput")
     const qrData = manualInput.value.trim()
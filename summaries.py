@@ -0,0 +1,136 @@
+import math
+import zlib
+from collections import defaultdict
+from datastore import Increment, DELETE_FIELD, MAX_BATCH_SIZE
+from app import app, db
+
+COLLECTION = 'session_summaries'
+
+# Attendees per summary document. Every scan writes its shard, so a lecture's
+# burst is spread across shards to stay near Firestore's per-document write
+# rate; at roughly 100 bytes an entry each shard is also far under 1 MiB.
+SHARD_CAPACITY = 100
+
+
+def shard_count(roster_size):
+    """Number of summary shards for a session with the given roster size"""
+    return max(1, math.ceil(roster_size / SHARD_CAPACITY))
+
+
+def _shard_id(session_id, index):
+    return session_id if index == 0 else f'{session_id}__{index}'
+
+
+def _shard_for(session_id, student_id, shards):
+    return _shard_id(session_id, zlib.crc32(student_id.encode()) % shards)
+
+
+def record_attendance(batch, attendance_data, shards=1):
+    """Add the attendee to the session summary as part of a batch"""
+    session_id = attendance_data['session_id']
+    student_id = attendance_data['student_id']
+    batch.set(db.collection(COLLECTION).document(_shard_for(session_id, student_id, shards)), {
+        'session_id': session_id,
+        'course_id': attendance_data['course_id'],
+        'count': Increment(1),
+        'attendees': {
+            student_id: {
+                'student_name': attendance_data.get('student_name', 'Unknown'),
+                'timestamp': attendance_data.get('timestamp')
+            }
+        }
+    }, merge=True)
+
+
+def discard_attendance(batch, attendance_data, shards=1):
+    """Remove an attendee from the session summary as part of a batch"""
+    session_id = attendance_data['session_id']
+    student_id = attendance_data['student_id']
+    batch.set(db.collection(COLLECTION).document(_shard_for(session_id, student_id, shards)), {
+        'count': Increment(-1),
+        'attendees': {student_id: DELETE_FIELD}
+    }, merge=True)
+
+
+def get_attendees(session_id, shards=1):
+    """All attendees of a session as dicts, oldest first, in one read"""
+    references = [db.collection(COLLECTION).document(_shard_id(session_id, index)) for index in range(shards)]
+    attendees = []
+    for snapshot in db.get_all(references):
+        if snapshot.exists:
+            for student_id, entry in (snapshot.to_dict().get('attendees') or {}).items():
+                attendees.append({
+                    'student_id': student_id,
+                    'student_name': entry.get('student_name', 'Unknown'),
+                    'timestamp': entry.get('timestamp')
+                })
+    return sorted(attendees, key=lambda attendee: (attendee['timestamp'] is None, attendee['timestamp'] or 0))
+
+
+def delete_summaries(session_id, shards=1, batch=None):
+    """Delete every shard of a session's summary"""
+    for index in range(shards):
+        reference = db.collection(COLLECTION).document(_shard_id(session_id, index))
+        if batch is not None:
+            batch.delete(reference)
+        else:
+            reference.delete()
+
+
+def rebuild_summaries(client=None):
+    """Recompute every session summary from the raw attendance records
+
+    Sessions created before summaries existed are given a shard count
+    sized to their attendance.
+    """
+    client = client or db
+    attendance = defaultdict(list)
+    fields = ['session_id', 'course_id', 'student_id', 'student_name', 'timestamp']
+    for record in client.collection('attendance').select(fields).stream():
+        record_data = record.to_dict()
+        attendance[record_data['session_id']].append(record_data)
+
+    summaries = {}
+    batch = client.batch()
+    for session in client.collection('attendance_sessions').select(['course_id', 'summary_shards']).stream():
+        session_data = session.to_dict()
+        records = attendance.get(session.id, [])
+        shards = session_data.get('summary_shards')
+        if shards is None:
+            shards = shard_count(len(records))
+            batch.update(session.reference, {'summary_shards': shards})
+        for record_data in records:
+            document_id = _shard_for(session.id, record_data['student_id'], shards)
+            if document_id not in summaries:
+                summaries[document_id] = {'session_id': session.id, 'course_id': session_data['course_id'], 'count': 0, 'attendees': {}}
+            summary = summaries[document_id]
+            summary['count'] += 1
+            summary['attendees'][record_data['student_id']] = {
+                'student_name': record_data.get('student_name', 'Unknown'),
+                'timestamp': record_data.get('timestamp')
+            }
+        if len(batch) >= MAX_BATCH_SIZE:
+            batch.commit()
+            batch = client.batch()
+
+    for summary in client.collection(COLLECTION).select([]).stream():
+        if summary.id not in summaries:
+            batch.delete(summary.reference)
+            if len(batch) >= MAX_BATCH_SIZE:
+                batch.commit()
+                batch = client.batch()
+
+    for document_id, summary in summaries.items():
+        batch.set(client.collection(COLLECTION).document(document_id), summary)
+        if len(batch) >= MAX_BATCH_SIZE:
+            batch.commit()
+            batch = client.batch()
+    batch.commit()
+
+    return len(summaries)
+
+
+@app.cli.command('rebuild-summaries')
+def rebuild_summaries_command():
+    """Recompute session summaries from raw attendance records."""
+    print(f'Wrote {rebuild_summaries()} session summary documents')
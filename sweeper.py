@@ -0,0 +1,48 @@
+from datetime import datetime
+from datastore import MAX_BATCH_SIZE
+from app import app, db
+from models import session_cache
+import scheduler
+
+
+def sweep_expired_sessions(client=None, now=None):
+    """Deactivate every active session past its expiry, one batch per page"""
+    client = client or db
+    # Naive local time, the same way generate_qr_code writes expires_at
+    now = now or datetime.now()
+    deactivated = 0
+
+    # Deactivated sessions drop out of the query, so each page starts from the top
+    while True:
+        expired = list(
+            client.collection('attendance_sessions')
+            .where('active', '==', True)
+            .where('expires_at', '<', now)
+            .select([])
+            .limit(MAX_BATCH_SIZE)
+            .stream()
+        )
+        if not expired:
+            return deactivated
+
+        batch = client.batch()
+        for snapshot in expired:
+            batch.update(snapshot.reference, {'active': False})
+        batch.commit()
+
+        for snapshot in expired:
+            session_cache.invalidate(snapshot.id)
+        deactivated += len(expired)
+
+        if len(expired) < MAX_BATCH_SIZE:
+            return deactivated
+
+
+@app.cli.command('sweep-sessions')
+def sweep_sessions_command():
+    """Deactivate attendance sessions that have expired."""
+    print(f'Deactivated {sweep_expired_sessions()} expired sessions')
+
+
+# Keep the active flag accurate without writes on the scan path
+scheduler.every('sweep-sessions', app.config['SESSION_SWEEP_INTERVAL'], sweep_expired_sessions)
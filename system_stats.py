@@ -0,0 +1,105 @@
+import random
+from collections import Counter
+from datastore import Increment
+from app import app, db
+import scheduler
+
+COLLECTION = 'system_stats'
+
+# Every scan in the institution increments these totals, so writes are spread
+# across shards to stay under Firestore's per-document write rate.
+NUM_SHARDS = 10
+
+FIELDS = (
+    'total_users', 'total_students', 'total_lecturers', 'total_admins', 'pending_approvals',
+    'total_courses', 'total_enrollments', 'total_attendance',
+)
+
+ROLE_FIELDS = {
+    'student': 'total_students',
+    'lecturer': 'total_lecturers',
+    'admin': 'total_admins',
+}
+
+
+def _shard(index, client=None):
+    return (client or db).collection(COLLECTION).document(f'shard_{index}')
+
+
+def adjust(batch=None, **deltas):
+    """Increment system totals, as part of a batch when one is given"""
+    deltas = {field: Increment(delta) for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    reference = _shard(random.randrange(NUM_SHARDS))
+    if batch is not None:
+        batch.set(reference, deltas, merge=True)
+    else:
+        reference.set(deltas, merge=True)
+
+
+def user_deltas(user_data, sign=1):
+    """Totals affected by adding (sign=1) or removing (sign=-1) a user"""
+    deltas = Counter({'total_users': sign})
+    role_field = ROLE_FIELDS.get(user_data.get('role'))
+    if role_field:
+        deltas[role_field] += sign
+    if not user_data.get('approved', False):
+        deltas['pending_approvals'] += sign
+    return dict(deltas)
+
+
+def get_system_stats(client=None):
+    """Current system totals, summed across shards in one read"""
+    client = client or db
+    totals = dict.fromkeys(FIELDS, 0)
+    for snapshot in client.get_all([_shard(index, client) for index in range(NUM_SHARDS)]):
+        if snapshot.exists:
+            data = snapshot.to_dict()
+            for field in FIELDS:
+                totals[field] += data.get(field, 0)
+    return totals
+
+
+def _count(query):
+    return query.count().get()[0][0].value
+
+
+def reconcile(client=None):
+    """Recompute the totals from the source collections and correct any drift
+
+    Totals come from count() aggregations, so no documents are read. The
+    difference from the current shard totals is applied as increments,
+    leaving writes that land while reconciling intact.
+    """
+    client = client or db
+    users = client.collection('users')
+    totals = {
+        'total_users': _count(users),
+        # Same filter as the admin dashboard's pending list; both front ends always write the flag
+        'pending_approvals': _count(users.where('approved', '==', False)),
+        'total_courses': _count(client.collection('courses')),
+        'total_enrollments': _count(client.collection('enrollments')),
+        'total_attendance': _count(client.collection('attendance')),
+    }
+    for role, field in ROLE_FIELDS.items():
+        totals[field] = _count(users.where('role', '==', role))
+
+    current = get_system_stats(client)
+    deltas = {field: Increment(totals[field] - current[field]) for field in FIELDS if totals[field] != current[field]}
+    if deltas:
+        _shard(0, client).set(deltas, merge=True)
+
+    return {field: totals[field] for field in FIELDS}
+
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """Recompute the system statistics document from source collections."""
+    totals = reconcile()
+    for field, value in totals.items():
+        print(f'{field}: {value}')
+
+
+# Optional periodic reconciliation corrects drift from partial failures
+scheduler.every('reconcile-stats', app.config['STATS_RECONCILE_INTERVAL'], reconcile)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Run against the in-process backend, without background jobs
+os.environ.setdefault('DATA_BACKEND', 'memory')
+os.environ.setdefault('STATS_RECONCILE_INTERVAL', '0')
+os.environ.setdefault('SESSION_SWEEP_INTERVAL', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
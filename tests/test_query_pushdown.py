@@ -0,0 +1,113 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from analytics import analytics
+from models import add_attendance_writes
+from queries import build_query
+import rollups
+
+STUDENT_ID = 'student-1'
+COURSES = ['course-a', 'course-b']
+
+# Three years of weekly lectures in each course
+WEEKS = 156
+
+
+class Fetched:
+    """Documents and approximate bytes the backend returns to queries"""
+
+    def __init__(self):
+        self.documents = 0
+        self.bytes = 0
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    stats = Fetched()
+    # Count at the backend itself, beneath the metrics wrapper
+    client = getattr(db, '_wrapped', db)
+    run_query = client._run_query
+
+    def counting_run_query(query):
+        snapshots = run_query(query)
+        for snapshot in snapshots:
+            stats.documents += 1
+            stats.bytes += len(json.dumps(snapshot.to_dict(), default=str))
+        return snapshots
+
+    monkeypatch.setattr(client, '_run_query', counting_run_query)
+    return stats
+
+
+@pytest.fixture(autouse=True)
+def multi_year_student():
+    client = getattr(db, '_wrapped', db)
+    client._collections.clear()
+    client._indexes.clear()
+    analytics.invalidate()
+
+    now = datetime.now()
+    db.collection('users').document(STUDENT_ID).set({'name': 'Student 1', 'role': 'student', 'created_at': now})
+    batch = db.batch()
+    for course_id in COURSES:
+        db.collection('courses').document(course_id).set({'name': course_id.title(), 'code': course_id.upper()})
+        for week in range(WEEKS):
+            session_id = f'{course_id}-{week}'
+            add_attendance_writes(batch, {
+                'student_id': STUDENT_ID,
+                'course_id': course_id,
+                'session_id': session_id,
+                'student_name': 'Student 1',
+                'timestamp': now - timedelta(weeks=week, hours=1),
+                'marked_by': 'qr_scan'
+            })
+            if len(batch) >= 400:
+                batch.commit()
+                batch = db.batch()
+    batch.commit()
+    yield
+    analytics.invalidate()
+
+
+def _full_history(fetched):
+    list(db.collection('attendance').where('student_id', '==', STUDENT_ID).stream())
+    return fetched.documents, fetched.bytes
+
+
+def test_student_analytics_reads_only_the_window(fetched):
+    history_documents, history_bytes = _full_history(fetched)
+    assert history_documents == len(COURSES) * WEEKS
+
+    fetched.documents = fetched.bytes = 0
+    result = analytics.get_student_analytics(STUDENT_ID, days=30)
+
+    assert result['total_attendance'] == len(COURSES) * 5
+    assert {course['course_id']: course['count'] for course in result['course_breakdown']} == dict.fromkeys(COURSES, WEEKS)
+
+    # The window's records and one counter per course, instead of three years of records
+    assert fetched.documents <= len(COURSES) * 5 + len(COURSES)
+    assert fetched.bytes * 10 < history_bytes
+
+
+def test_projection_fetches_only_requested_fields(fetched):
+    _, whole_bytes = _full_history(fetched)
+
+    fetched.documents = fetched.bytes = 0
+    records = list(build_query('attendance', {'student_id': STUDENT_ID}, fields=['timestamp']).stream())
+
+    assert fetched.documents == len(COURSES) * WEEKS
+    assert all(set(record.to_dict()) == {'timestamp'} for record in records)
+    assert fetched.bytes * 3 < whole_bytes
+
+
+def test_total_rollups_skip_per_student_counts(fetched):
+    whole = rollups.get_rollups(days=365 * 3)
+    whole_bytes = fetched.bytes
+
+    fetched.bytes = 0
+    totals_only = rollups.get_rollups(days=365 * 3, fields=rollups.TOTAL_FIELDS)
+
+    assert rollups.totals(totals_only) == rollups.totals(whole)
+    assert not any('students' in rollup for rollup in totals_only)
+    assert fetched.bytes < whole_bytes
@@ -0,0 +1,35 @@
+import json
+from datetime import datetime
+import pytest
+from app import app, db
+import routes
+
+
+@pytest.fixture
+def admin_client(monkeypatch):
+    client = getattr(db, '_wrapped', db)
+    client._collections.clear()
+    client._indexes.clear()
+    monkeypatch.setitem(app.config, 'REPORT_PAGE_SIZE', 3)
+
+    test_client = app.test_client()
+    with test_client.session_transaction() as sess:
+        sess['user'] = {'uid': 'admin-0', 'email': 'admin@example.edu', 'role': 'admin', 'name': 'Admin', 'approved': True}
+    return test_client
+
+
+def test_system_report_lists_documents_without_created_at(admin_client):
+    for index in range(7):
+        db.collection('users').document(f'user-{index}').set({'name': f'User {index}', 'role': 'student', 'created_at': datetime.now()})
+        db.collection('courses').document(f'course-{index}').set({'name': f'Course {index}', 'code': f'C{index}'})
+    # Written by the Next.js front end, which uses camelCase field names
+    db.collection('users').document('next-user').set({'name': 'Next User', 'role': 'student', 'createdAt': datetime.now()})
+
+    for query_string in ('format=json', 'format=json&pretty=1'):
+        report = json.loads(admin_client.get(f'/api/reports/system?{query_string}').get_data(as_text=True))
+        assert sorted(user['id'] for user in report['users']) == sorted([f'user-{index}' for index in range(7)] + ['next-user'])
+        assert len(report['courses']) == 7
+
+    lines = admin_client.get('/api/reports/system?format=ndjson').get_data(as_text=True).splitlines()
+    sections = [json.loads(line)['section'] for line in lines]
+    assert sections.count('users') == 8 and sections.count('courses') == 7
@@ -0,0 +1,88 @@
+import base64
+import hashlib
+import hmac
+import time
+from app import app
+
+# Prefix identifying version 1 of the EduTrack attendance token
+TOKEN_PREFIX = 'ea1'
+
+# Truncated HMAC-SHA256 length in bytes (128 bits)
+SIGNATURE_BYTES = 16
+
+
+def _signing_key():
+    return (app.config.get('QR_SIGNING_KEY') or app.secret_key).encode()
+
+
+def _signature(message):
+    digest = hmac.new(_signing_key(), message.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def _to_base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
+
+
+def sign_qr_token(course_id, session_id, expires_at):
+    """Build a compact signed attendance token: ea1.<course>.<session>.<expiry>.<signature>"""
+    if '.' in course_id or '.' in session_id:
+        raise ValueError('Course and session ids may not contain dots')
+    message = f'{TOKEN_PREFIX}.{course_id}.{session_id}.{_to_base36(int(expires_at.timestamp()))}'
+    return f'{message}.{_signature(message)}'
+
+
+def scan_key(session_id):
+    """Key a lecturer's device uses to sign the times of scans it records offline for one session"""
+    digest = hmac.new(_signing_key(), f'scan.{session_id}'.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def scan_signature(key, session_id, student_id, scanned_at):
+    """Hex HMAC-SHA256 of <session>.<student>.<epoch milliseconds> under a session's scan key"""
+    return hmac.new(key.encode(), f'{session_id}.{student_id}.{scanned_at}'.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_scan_signature(session_id, student_id, scanned_at, signature):
+    """Whether an offline scan time (integer epoch milliseconds) was signed with the session's scan key"""
+    if not session_id or not isinstance(signature, str) or not isinstance(scanned_at, int) or isinstance(scanned_at, bool):
+        return False
+    return hmac.compare_digest(signature, scan_signature(scan_key(session_id), session_id, student_id, scanned_at))
+
+
+def token_session_id(token):
+    """Session id claimed by a token, without checking its signature"""
+    parts = token.split('.') if isinstance(token, str) else []
+    return parts[2] if len(parts) == 5 and parts[0] == TOKEN_PREFIX else None
+
+
+def verify_qr_token(token, now=None):
+    """Check a token's signature and expiry without touching the backend"""
+    parts = token.strip().split('.') if isinstance(token, str) else []
+    if len(parts) != 5 or parts[0] != TOKEN_PREFIX:
+        return {'valid': False, 'message': 'Invalid QR code format'}
+
+    message, signature = '.'.join(parts[:4]), parts[4]
+    if not hmac.compare_digest(signature, _signature(message)):
+        return {'valid': False, 'message': 'Invalid QR code'}
+
+    try:
+        expires_at = int(parts[3], 36)
+    except ValueError:
+        return {'valid': False, 'message': 'Invalid QR code format'}
+
+    if (now if now is not None else time.time()) > expires_at:
+        return {'valid': False, 'message': 'Session has expired'}
+
+    return {
+        'valid': True,
+        'course_id': parts[1],
+        'session_id': parts[2],
+        'expires_at': expires_at
+    }
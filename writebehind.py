@@ -0,0 +1,248 @@
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from datastore import AlreadyExists, Increment, MAX_BATCH_SIZE, commit_with_retry
+from app import app, db
+from counters import COUNTERS_PER_RECORD
+import metrics
+
+# Claims older than this are assumed to belong to a crashed worker
+CLAIM_TIMEOUT_SECONDS = 60
+
+# Flushed entries are kept this long so repeat scans are still recognised
+RETAIN_FLUSHED_SECONDS = 24 * 60 * 60
+
+# Room left in a batch for one more entry: its record plus the aggregates it updates
+WRITES_PER_ENTRY = COUNTERS_PER_RECORD + 1
+
+
+def _merge_fields(existing, data):
+    """Combine two merge-set payloads for the same document"""
+    merged = dict(existing)
+    for key, value in data.items():
+        current = merged.get(key)
+        if isinstance(value, Increment) and isinstance(current, Increment):
+            merged[key] = Increment(current.value + value.value)
+        elif isinstance(value, dict) and isinstance(current, dict):
+            merged[key] = _merge_fields(current, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class CoalescingBatch:
+    """Batch that folds repeated merge-sets of one document into a single write
+
+    A flush of many scans increments the same session, course and system
+    counters over and over; coalescing turns those into one write each.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._creates = []
+        self._merges = {}
+
+    def __len__(self):
+        return len(self._creates) + len(self._merges)
+
+    def create(self, reference, document_data):
+        self._creates.append((reference, document_data))
+        return self
+
+    def set(self, reference, document_data, merge=False):
+        if not merge:
+            raise ValueError('CoalescingBatch only supports merge=True sets')
+        key = reference.path
+        if key in self._merges:
+            self._merges[key] = (reference, _merge_fields(self._merges[key][1], document_data))
+        else:
+            self._merges[key] = (reference, document_data)
+        return self
+
+    def commit(self):
+        batch = self._client.batch()
+        for reference, document_data in self._creates:
+            batch.create(reference, document_data)
+        for reference, document_data in self._merges.values():
+            batch.set(reference, document_data, merge=True)
+        return batch.commit()
+
+
+class AttendanceWriteQueue:
+    """Durable local queue of accepted scans, flushed to the backend in batches
+
+    Entries are committed to a SQLite journal before the student is
+    acknowledged, so a crash never loses an accepted scan. A background
+    thread claims entries, writes them with one batch per flush and marks
+    them flushed once the backend has them. Several workers on one host may
+    share the journal; claims held by a dead worker are retaken.
+    """
+
+    def __init__(self, path, flush_interval=0.02):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.owner = f'{os.getpid()}-{id(self)}'
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS pending ('
+            'seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL UNIQUE, payload BLOB NOT NULL, '
+            'claimed_by TEXT, claimed_at REAL, flushed_at REAL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS pending_flushed_at ON pending (flushed_at)')
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.flushes = 0
+        self.flushed_entries = 0
+        self.flush_seconds = 0.0
+        self.last_flush_seconds = 0.0
+
+    def enqueue(self, doc_id, attendance_data, shards=1):
+        """Durably queue a scan; returns False if it was already accepted"""
+        payload = pickle.dumps((attendance_data, shards), pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            cursor = self._conn.execute('INSERT OR IGNORE INTO pending (doc_id, payload) VALUES (?, ?)', (doc_id, payload))
+        return cursor.rowcount == 1
+
+    def depth(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM pending WHERE flushed_at IS NULL').fetchone()[0]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='attendance-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """Stop the flusher and write out everything still queued"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        while self.flush():
+            pass
+
+    def _run(self):
+        # Scans arriving within one interval share a flush
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                # Keep flushing while there is a backlog
+                while self.flush() and not self._stopped.is_set():
+                    pass
+            except Exception as e:
+                print(f"Error flushing attendance writes: {e}")
+                time.sleep(1)
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'UPDATE pending SET claimed_by = ?, claimed_at = ? WHERE seq IN ('
+                    'SELECT seq FROM pending WHERE flushed_at IS NULL AND (claimed_by IS NULL OR claimed_at < ?) '
+                    'ORDER BY seq LIMIT ?)',
+                    (self.owner, now, now - CLAIM_TIMEOUT_SECONDS, MAX_BATCH_SIZE // 2)
+                )
+                rows = self._conn.execute(
+                    'SELECT seq, doc_id, payload FROM pending WHERE claimed_by = ? AND flushed_at IS NULL ORDER BY seq',
+                    (self.owner,)
+                ).fetchall()
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [(seq, doc_id, pickle.loads(payload)) for seq, doc_id, payload in rows]
+
+    def _release(self, seqs):
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE pending SET claimed_by = NULL WHERE seq IN ({','.join('?' * len(seqs))})", seqs
+            )
+
+    def _mark_flushed(self, seqs):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE pending SET flushed_at = ? WHERE seq IN ({','.join('?' * len(seqs))})", [now] + seqs
+            )
+            self._conn.execute('DELETE FROM pending WHERE flushed_at < ?', (now - RETAIN_FLUSHED_SECONDS,))
+
+    def flush(self):
+        """Write one batch of claimed entries; returns how many were handled"""
+        from models import add_attendance_writes
+        from live import live_hub
+        from analytics import analytics
+
+        entries = self._claim()
+        if not entries:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            # Skip scans that already reached the backend (retries, other workers)
+            references = [db.collection('attendance').document(doc_id) for _, doc_id, _ in entries]
+            existing = {snapshot.id for snapshot in db.get_all(references) if snapshot.exists}
+
+            batch = CoalescingBatch(db)
+            written = []
+            for seq, doc_id, (attendance_data, shards) in entries:
+                if doc_id in existing:
+                    continue
+                if len(batch) + WRITES_PER_ENTRY > MAX_BATCH_SIZE:
+                    break
+                add_attendance_writes(batch, attendance_data, shards)
+                written.append((seq, attendance_data))
+
+            handled = {seq for seq, doc_id, _ in entries if doc_id in existing} | {seq for seq, _ in written}
+            if written:
+                commit_with_retry(batch)
+        except AlreadyExists:
+            # Lost a race with another writer; the next pass re-checks existence
+            self._release([seq for seq, _, _ in entries])
+            return len(entries)
+        except Exception:
+            self._release([seq for seq, _, _ in entries])
+            raise
+
+        if handled:
+            self._mark_flushed(sorted(handled))
+        unhandled = [seq for seq, _, _ in entries if seq not in handled]
+        if unhandled:
+            self._release(unhandled)
+
+        elapsed = time.perf_counter() - start
+        self.flushes += 1
+        self.flushed_entries += len(written)
+        self.flush_seconds += elapsed
+        self.last_flush_seconds = elapsed
+
+        for _, attendance_data in written:
+            live_hub.publish(attendance_data['session_id'], attendance_data)
+            analytics.invalidate(attendance_data['student_id'], attendance_data['course_id'])
+
+        return len(entries)
+
+
+write_queue = None
+
+if app.config['ATTENDANCE_WRITE_BEHIND']:
+    write_queue = AttendanceWriteQueue(app.config['WRITE_BEHIND_PATH'], app.config['WRITE_BEHIND_INTERVAL'])
+    write_queue.start()
+
+    metrics.registry.gauge('edutrack_write_behind_queue_depth', 'Scans waiting to be flushed', write_queue.depth)
+    metrics.registry.gauge('edutrack_write_behind_flushes_total', 'Batched flushes committed',
+                           lambda: write_queue.flushes, 'counter')
+    metrics.registry.gauge('edutrack_write_behind_flushed_entries_total', 'Scans written by flushes',
+                           lambda: write_queue.flushed_entries, 'counter')
+    metrics.registry.gauge('edutrack_write_behind_flush_seconds_total', 'Time spent in flushes',
+                           lambda: write_queue.flush_seconds, 'counter')
+    metrics.registry.gauge('edutrack_write_behind_last_flush_seconds', 'Duration of the most recent flush',
+                           lambda: write_queue.last_flush_seconds)